@@ -1,28 +1,43 @@
 import time
 
+import numpy as np
+
 
 class MovingAverageWithRate(object):
     """
     Computes the moving average (with optional sample rate) of supplied
     samples over a given window size.
 
-    Add new samples with add()
+    Add new samples with add() or add_many(). The samples and their time
+    stamps are kept in preallocated ring buffers, so adding is O(1).
     """
 
-    def __init__(self, window_size):
+    def __init__(self, window_size, decay=None):
         """
         :param window_size: int
             Window size (number of retained samples) for computing average.
             Must be > 0.
+
+        :param decay: float, optional
+            If given (in (0, 1)), average is an exponentially decaying
+            average instead of the mean of the window: every new sample
+            gets weight 1 - decay and older ones are multiplied by decay.
+            The rate and percentiles still use the window.
         """
         if not isinstance(window_size, int):
             raise TypeError("window_size must be int")
         if window_size < 1:
             raise ValueError("window_size must be > 0")
+        if decay is not None and not 0 < decay < 1:
+            raise ValueError("decay must be in (0, 1)")
 
         self.window_size = window_size
-        self.samples = []
-        self.time_stamps = []
+        self.decay = decay
+        self.samples = np.zeros(window_size)
+        self.time_stamps = np.zeros(window_size, dtype=np.int64)
+        # slot of the next sample, and number of retained samples
+        self.head = 0
+        self.count = 0
         self.accumulator = 0.0
         self.average = 0.0
         self.rate = 0.0
@@ -45,19 +60,106 @@ class MovingAverageWithRate(object):
 
         time_stamp = time.time_ns() if time_stamp is None else time_stamp
 
-        if len(self.samples) == self.window_size:
-            self.accumulator -= self.samples.pop(0)
-            self.time_stamps.pop(0)
-
-        self.samples.append(sample)
-        self.time_stamps.append(time_stamp)
+        head = self.head
+        if self.count == self.window_size:
+            self.accumulator -= self.samples.item(head)
+        else:
+            self.count += 1
+        self.samples[head] = sample
+        self.time_stamps[head] = time_stamp
         self.accumulator += sample
+        self.head = head + 1
+        if self.head == self.window_size:
+            self.head = 0
+            # drop the rounding errors of the running sum once per window
+            self.accumulator = self.samples[:self.count].sum().item()
+
+        if self.decay is None:
+            self.average = self.accumulator / self.count
+        elif self.count == 1:
+            self.average = float(sample)
+        else:
+            self.average = self.decay * self.average + (1 - self.decay) * sample
+
+        return self.average, self.update_rate()
+
+    def add_many(self, samples, time_stamps=None):
+        """
+        Adds several samples at once, oldest first; same as calling add()
+        for each of them.
+
+        :param samples: array_like of float
+
+        :param time_stamps: array_like of int, optional
+            Timestamps of the samples (nanoseconds). Default: all now.
+
+        :return: (average, rate): (float, float)
+        """
+        samples = np.asarray(samples, dtype=float).ravel()
+        n = len(samples)
+        if n == 0:
+            return self.average, self.rate
+        if time_stamps is None:
+            time_stamps = np.full(n, time.time_ns(), dtype=np.int64)
+        time_stamps = np.asarray(time_stamps, dtype=np.int64).ravel()
 
-        self.average = float(self.accumulator) / len(self.samples)
+        if self.decay is not None:
+            start = 0
+            if self.count == 0:
+                self.average = samples[0]
+                start = 1
+            d = self.decay
+            weights = (1 - d) * d ** np.arange(n - start - 1, -1, -1)
+            self.average = float(d ** (n - start) * self.average + weights @ samples[start:])
 
-        time_span = time_stamp - self.time_stamps[0]
+        # only the last window_size samples can be retained
+        kept = min(n, self.window_size)
+        slots = (self.head + np.arange(n - kept, n)) % self.window_size
+        self.samples[slots] = samples[n - kept:]
+        self.time_stamps[slots] = time_stamps[n - kept:]
+        self.head = (self.head + n) % self.window_size
+        self.count = min(self.count + n, self.window_size)
+        self.accumulator = self.samples[:self.count].sum().item()
+        if self.decay is None:
+            self.average = self.accumulator / self.count
+
+        return self.average, self.update_rate()
+
+    def update_rate(self):
+        """
+        sum of the retained samples per second between the oldest and the
+        newest of them
+        """
+        newest = self.time_stamps.item(self.head - 1)
+        oldest = self.time_stamps.item((self.head - self.count) % self.window_size)
+        time_span = newest - oldest
         self.rate = 0
         if time_span != 0:
             self.rate = self.accumulator * 1000000000. / time_span
+        return self.rate
+
+    def window(self):
+        """
+        :return: (samples, time_stamps) retained, oldest first (copies)
+        """
+        slots = (self.head - self.count + np.arange(self.count)) % self.window_size
+        return self.samples[slots], self.time_stamps[slots]
+
+    def percentile(self, q):
+        """
+        :param q: float or array_like, percentile(s) in [0, 100], e.g. 50 or 99
+        :return: percentile(s) of the retained samples
+        """
+        if self.count == 0:
+            return np.nan
+        return np.percentile(self.samples[:self.count], q)
 
-        return self.average, self.rate
+    def interval_percentile(self, q):
+        """
+        :param q: float or array_like, percentile(s) in [0, 100]
+        :return: percentile(s) of the time (ns) between consecutive retained
+            samples, e.g. frame times when adding a sample per frame
+        """
+        if self.count < 2:
+            return np.nan
+        return np.percentile(np.diff(self.window()[1]), q)
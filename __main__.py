@@ -1,8 +1,10 @@
 import argparse
 import pprint
+import time
 
-from image_viewer import ImageViewer
 from lattice_runner import LatticeRunner
+from parallel_runner import ParallelLatticeRunner
+from runner_process import RunnerProcess
 
 
 def zero_to_one(x):
@@ -16,11 +18,31 @@ def main():
     args = parse_args()
     pprint.pprint(vars(args))
 
-    runner = LatticeRunner(args)
-    viewer = ImageViewer(width=args.size,
-                         height=args.size,
-                         updateRate=args.updateRate,
-                         runner=runner)
+    if args.process:
+        runner = RunnerProcess(args)
+    elif args.workers > 1:
+        runner = ParallelLatticeRunner(args)
+    else:
+        runner = LatticeRunner(args)
+    if args.headless:
+        print("Hit Ctrl-C to abort")
+        runner.start()
+        try:
+            # sleep rather than join(timeout): interrupting join can leave
+            # the thread looking stopped while it is still running
+            while runner.is_alive():
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            runner.stop()
+            runner.join()
+        return
+
+    # only needed (and pygame only imported) when there is a display
+    from image_viewer import ImageViewer
+    if not args.process:
+        runner.make_frames()
+    viewer = ImageViewer(runner=runner,
+                         updateRate=args.updateRate)
     print("Hit ESC to abort")
     runner.start()
     viewer.start()
@@ -30,10 +52,21 @@ def main():
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-s", "--size",
+    parser.add_argument("-W", "--width",
                         type=int,
-                        help="Size of the lattice (size x size)",
+                        help="Number of columns of the lattice",
                         default=50)
+    parser.add_argument("-H", "--height",
+                        type=int,
+                        help="Number of rows of the lattice, 1 (or a width of 1) for a one "
+                             "dimensional lattice. Default: same as width",
+                        default=None)
+    parser.add_argument("--boundary",
+                        choices=["periodic", "reflecting", "fixed"],
+                        help="What lies beyond the edges of the lattice: periodic (it wraps "
+                             "around), reflecting (the edge cells, mirrored) or fixed (empty "
+                             "cells that never change)",
+                        default="periodic")
     parser.add_argument("-e", "--evolutions",
                         type=int,
                         help="Number of generations the lattice evolves",
@@ -75,11 +108,93 @@ def parse_args():
                         type=zero_to_one,
                         help="overall number ratio (number of blue/ total number of cells)",
                         default=1)
+    parser.add_argument("--sweep",
+                        action="store_true",
+                        help="If set, evolve the lattice in vectorized sweeps (every site "
+                             "updated once per sweep) instead of one random site at a time")
+    parser.add_argument("--workers",
+                        type=int,
+                        help="Number of worker processes. More than 1 runs vectorized sweeps "
+                             "(see --sweep) on bands of the lattice in parallel",
+                        default=1)
+    parser.add_argument("--activeSites",
+                        action="store_true",
+                        help="If set, only sample sites that can change (red/blue only)")
+    parser.add_argument("--backend",
+                        choices=["python", "numba"],
+                        help="Engine for single site updates. numba falls back to python "
+                             "if it is not installed",
+                        default="python")
+    parser.add_argument("--seed",
+                        type=int,
+                        help="Random seed, for reproducible runs",
+                        default=None)
+    parser.add_argument("--noEarlyStop",
+                        action="store_true",
+                        help="If set, keep running after a species died out (or, in any "
+                             "color mode, one is left)")
+    parser.add_argument("--steadyWindow",
+                        type=int,
+                        help="Stop once the counts are steady over this many samples (one "
+                             "per lattice's worth of updates), 0 to never stop early for this",
+                        default=0)
+    parser.add_argument("--steadyTolerance",
+                        type=float,
+                        help="Largest change of the mean counts between the halves of the "
+                             "steady state window, as a fraction of the lattice sites",
+                        default=0.001)
+    parser.add_argument("--checkpoint",
+                        help="Path (without extension) to save checkpoints to periodically "
+                             "and at the end of the run",
+                        default=None)
+    parser.add_argument("--checkpointInterval",
+                        type=float,
+                        help="Seconds between checkpoints",
+                        default=600)
+    parser.add_argument("--restore",
+                        help="Path (without extension) of a checkpoint to continue from. "
+                             "Lattice options are taken from the checkpoint",
+                        default=None)
+    parser.add_argument("--record",
+                        help="Directory to record counts, interface length and throughput "
+                             "(and snapshots, see --snapshotInterval) to",
+                        default=None)
+    parser.add_argument("--recordInterval",
+                        type=int,
+                        help="Generations between records, default one per lattice site",
+                        default=0)
+    parser.add_argument("--snapshotInterval",
+                        type=int,
+                        help="Generations between recorded lattice snapshots, 0 for none",
+                        default=0)
+    parser.add_argument("--process",
+                        action="store_true",
+                        help="If set, run the simulation in a separate process, sharing "
+                             "frames with the display through shared memory")
+    parser.add_argument("--ruleStats",
+                        action="store_true",
+                        help="If set, count and time the rules applied by single site updates "
+                             "(python backend) and show them with the stats")
+    parser.add_argument("--profile",
+                        help="File to write a cProfile profile of the simulation to, "
+                             "see stats.py",
+                        default=None)
+    parser.add_argument("--headless",
+                        action="store_true",
+                        help="If set, run without a display and print stats periodically")
+    parser.add_argument("--statsInterval",
+                        type=float,
+                        help="Seconds between stats printed in headless mode",
+                        default=5)
     parser.add_argument("--updateRate",
                         type=int,
                         help="Rate at which display is updated (Hz)",
                         default=60)
     args = parser.parse_args()
+    if args.height is None:
+        args.height = args.width
+    if args.steadyWindow < 0 or args.steadyWindow == 1:
+        parser.error("--steadyWindow needs at least 2 samples (or 0)")
     return args
 
 
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class ActiveSites(object):
+    """
+    A set of lattice sites (flat indices) with O(1) add, remove and
+    uniform random sampling.
+
+    Members are kept densely packed at the front of an array; position[k]
+    is the slot of site k in that array, or -1 if k is not a member.
+    """
+
+    def __init__(self, n_sites, sites=()):
+        """
+        :param n_sites: int
+            Total number of sites, i.e. flat indices are in [0, n_sites).
+
+        :param sites: sequence of int, optional
+            Initial members.
+        """
+        self.sites = np.empty(n_sites, dtype=np.int64)
+        self.position = np.full(n_sites, -1, dtype=np.int64)
+        self.size = len(sites)
+        self.sites[:self.size] = sites
+        self.position[self.sites[:self.size]] = np.arange(self.size)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, k):
+        return self.position[k] >= 0
+
+    def add(self, k):
+        if self.position[k] < 0:
+            self.sites[self.size] = k
+            self.position[k] = self.size
+            self.size += 1
+
+    def remove(self, k):
+        p = self.position[k]
+        if p >= 0:
+            self.size -= 1
+            last = self.sites[self.size]
+            self.sites[p] = last
+            self.position[last] = p
+            self.position[k] = -1
+
+    def sample(self, u):
+        """
+        :param u: float, uniform random number in [0, 1)
+        :return: a member chosen uniformly at random
+        """
+        return self.sites[int(u * self.size)]
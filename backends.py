@@ -0,0 +1,147 @@
+"""
+Engines behind Lattice.evolve, i.e. single random site updates.
+
+"python" is the reference implementation in Lattice.evolve_python. "numba"
+runs the same rules in a compiled loop over the lattice array and only
+returns to the interpreter after all steps; it needs the optional numba
+package and falls back to "python" without it.
+"""
+import numpy as np
+
+from species import EMPTY, RED, BLUE
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+class PythonBackend(object):
+    name = "python"
+    # steps per evolve() call for callers that run in chunks
+    chunk = 1000
+
+    def evolve(self, lattice, n_steps):
+        lattice.evolve_python(n_steps)
+
+
+class NumbaBackend(object):
+    """
+    Compiled single site updates. The kernel draws from the backend's own
+    random state (see next_uniform), seeded from the lattice's generator,
+    so lattices do not share a random stream.
+    Per-cell observers and active site scheduling are not supported:
+    observers get lattice_changed after every call. The kernel keeps the
+    population up to date, the neighbor counts are only recomputed if the
+    python engine runs next (see Lattice.refresh).
+    """
+    name = "numba"
+    chunk = 1 << 20
+
+    def __init__(self, rng):
+        self.state = rng.integers(2 ** 64, size=1, dtype=np.uint64)
+
+    def evolve(self, lattice, n_steps):
+        kill_table = lattice.kill_table if lattice.kill_table is not None else np.zeros(1)
+        evolve_kernel(lattice.flat, lattice.population, lattice.x, lattice.y,
+                      lattice.flat_offsets,
+                      np.array(lattice.row_sources + lattice.col_sources),
+                      kill_table, lattice.onlyRedBlue, lattice.slider,
+                      lattice.redAdvantage, lattice.blueAdvantage, lattice.defKillers,
+                      lattice.thresh, self.state, n_steps)
+        lattice.generation += n_steps
+        lattice.refresh(population=False)
+
+
+def get_backend(name, rng):
+    """
+    :param name: "python" or "numba"
+    :param rng: np.random.Generator to seed the backend from
+    :return: backend instance
+    """
+    if name == "python":
+        return PythonBackend()
+    if name == "numba":
+        if njit is None:
+            print("numba is not installed, using the python backend")
+            return PythonBackend()
+        return NumbaBackend(rng)
+    raise ValueError("unknown backend %r" % (name,))
+
+
+def next_uniform(state):
+    """
+    advances a splitmix64 generator
+    :param state: uint64 array holding the generator's state
+    :return: uniform float in [0, 1)
+    """
+    state[0] += np.uint64(0x9E3779B97F4A7C15)
+    z = state[0]
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+def evolve_kernel(flat, population, x, y, offsets, sources, kill_table, only_red_blue, slider,
+                  red_advantage, blue_advantage, def_killers, thresh, state, n_steps):
+    """
+    n_steps single site updates with the rules of Lattice.evolve_python.
+
+    :param flat: the padded x by y lattice, flattened (see boundary.py)
+    :param population: Lattice.population, updated in place
+    :param offsets: Lattice.flat_offsets
+    :param sources: Lattice.row_sources + Lattice.col_sources
+    :param state: random state, see next_uniform
+    """
+    stride = y + 2
+    for t in range(n_steps):
+        k = int(next_uniform(state) * (x * y))
+        i, j = k // y, k % y
+        cell = (i + 1) * stride + j + 1
+        centre = flat[cell]
+
+        # random death: replace with a random cell of the neighborhood
+        if slider > next_uniform(state):
+            value = flat[cell + offsets[int(next_uniform(state) * len(offsets))]]
+
+        elif only_red_blue:
+            if centre == EMPTY or def_killers:
+                continue
+            enemy = BLUE if centre == RED else RED
+            advantage = blue_advantage if centre == RED else red_advantage
+            n_enemy = 0
+            for o in offsets:
+                if flat[cell + o] == enemy:
+                    n_enemy += 1
+            if n_enemy * next_uniform(state) * advantage <= thresh:
+                continue
+            value = EMPTY
+
+        elif centre != EMPTY:
+            weight = 0.0
+            for o in offsets:
+                s = flat[cell + o]
+                if s != EMPTY and s != centre:
+                    weight += kill_table[s]
+            if weight * next_uniform(state) <= 2:
+                continue
+            value = EMPTY
+
+        else:
+            continue
+
+        population[centre] -= 1
+        population[value] += 1
+        # the cell and its ghost copies
+        for a in (i + 1, 0 if i == sources[0] else -1, x + 1 if i == sources[1] else -1):
+            if a < 0:
+                continue
+            for b in (j + 1, 0 if j == sources[2] else -1, y + 1 if j == sources[3] else -1):
+                if b >= 0:
+                    flat[a * stride + b] = value
+
+
+if njit is not None:
+    next_uniform = njit(cache=True)(next_uniform)
+    evolve_kernel = njit(cache=True)(evolve_kernel)
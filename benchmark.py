@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the simulation engine.
+
+For every lattice size, mode (red/blue or any) and slider value, times
+
+    create_red_blue_lattice / create_other_lattice
+    to_rgb_image
+    evolve, once per backend (updates/s)
+    evolve_sweep (updates/s)
+
+and writes the results as JSON, together with the versions and machine
+they were measured on, so runs of different versions or backends can be
+compared:
+
+    python benchmark.py results.json --sizes 64 256 --sliders 0 --backends python
+
+Sizes are n (n x n) or WIDTHxHEIGHT, e.g. 1000000x1 for a one dimensional
+lattice.
+
+Each measurement repeats the operation until it has taken at least
+--seconds, after one untimed warm up call (which also compiles numba).
+"""
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+
+from lattice import Lattice
+
+
+def measure(func, seconds):
+    """
+    calls func until at least seconds have passed
+    :param func: callable returning the number of updates it did (or None)
+    :return: dict with the number of calls, total seconds, seconds per
+        call and, if func returns update counts, updates per second
+    """
+    func()
+    calls, updates = 0, 0
+    start = now = time.perf_counter()
+    while calls == 0 or now - start < seconds:
+        n = func()
+        updates += n or 0
+        calls += 1
+        now = time.perf_counter()
+    result = {"calls": calls, "seconds": now - start, "seconds_per_call": (now - start) / calls}
+    if updates:
+        result["updates_per_second"] = updates / (now - start)
+    return result
+
+
+def call(func, *args):
+    """
+    :return: a function calling func(*args) that returns None, for
+        measuring operations that do not update the lattice
+    """
+    def call_func():
+        func(*args)
+    return call_func
+
+
+def run_evolve(lattice, chunk):
+    def evolve():
+        start = lattice.generation
+        lattice.evolve(chunk)
+        return lattice.generation - start
+    return evolve
+
+
+def run_sweep(lattice):
+    def sweep():
+        start = lattice.generation
+        lattice.evolve_sweep(1)
+        return lattice.generation - start
+    return sweep
+
+
+def benchmarks(size, onlyRedBlue, slider, backends, seconds, seed):
+    """
+    runs all benchmarks of one lattice configuration
+    :return: list of result dicts
+    """
+    params = dict(size=size, onlyRedBlue=onlyRedBlue, slider=slider)
+    lattice = Lattice(seed=seed, **params)
+    if onlyRedBlue:
+        cases = [("create_red_blue_lattice",
+                  call(lattice.create_red_blue_lattice, lattice.density, lattice.numRatio))]
+    else:
+        cases = [("create_other_lattice", call(lattice.create_other_lattice, lattice.density))]
+    cases.append(("to_rgb_image", call(lattice.to_rgb_image)))
+    for backend in backends:
+        evolved = Lattice(seed=seed, backend=backend, **params)
+        cases.append(("evolve", run_evolve(evolved, evolved.backend.chunk),
+                      {"backend": evolved.backend.name}))
+    cases.append(("evolve_sweep", run_sweep(lattice)))
+
+    results = []
+    for case in cases:
+        name, func = case[:2]
+        result = dict(params, benchmark=name)
+        if len(case) > 2:
+            result.update(case[2])
+        result.update(measure(func, seconds))
+        print("{:>9} {:<5} slider={:<4} {:<24} {:>10.6f}s/call {}".format(
+            size if np.isscalar(size) else "%dx%d" % tuple(size), "rb" if onlyRedBlue else "any", slider,
+            name + (" (%s)" % result["backend"] if "backend" in result else ""),
+            result["seconds_per_call"],
+            "{:,.0f} updates/s".format(result["updates_per_second"])
+            if "updates_per_second" in result else ""), flush=True)
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    modes = {"rb": True, "any": False}
+    results = []
+    for size in args.sizes:
+        for mode in args.modes:
+            for slider in args.sliders:
+                results.extend(benchmarks(size, modes[mode], slider, args.backends,
+                                          args.seconds, args.seed))
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(),
+                    "python": platform.python_version(), "numpy": np.__version__},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to %s" % args.output)
+
+
+def lattice_size(text):
+    """
+    :param text: "n" or "WIDTHxHEIGHT"
+    :return: Lattice size
+    """
+    try:
+        if "x" in text:
+            return [int(n) for n in text.split("x")]
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%r is not n or WIDTHxHEIGHT" % (text,))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulation engine benchmarks")
+    parser.add_argument("output",
+                        help="JSON file to write the results to")
+    parser.add_argument("--sizes",
+                        type=lattice_size,
+                        nargs="+",
+                        help="Lattice sizes: n (n x n) or WIDTHxHEIGHT",
+                        default=[64, 256, 1024, 4096, 8192])
+    parser.add_argument("--modes",
+                        choices=["rb", "any"],
+                        nargs="+",
+                        help="rb: only red and blue bacteria, any: any bacteria",
+                        default=["rb", "any"])
+    parser.add_argument("--sliders",
+                        type=float,
+                        nargs="+",
+                        help="Slider values",
+                        default=[0, 0.5])
+    parser.add_argument("--backends",
+                        choices=["python", "numba"],
+                        nargs="+",
+                        help="Backends to time evolve with",
+                        default=["python", "numba"])
+    parser.add_argument("--seconds",
+                        type=float,
+                        help="Minimum time spent on each measurement",
+                        default=1)
+    parser.add_argument("--seed",
+                        type=int,
+                        help="Random seed of the lattices",
+                        default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
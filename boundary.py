@@ -0,0 +1,96 @@
+"""
+Boundary conditions.
+
+A Lattice is stored with a margin of ghost cells around it (Lattice.padded,
+of which Lattice.lattice is the inner view), so every site has a whole
+neighborhood: reading it is a single gather at fixed flat offsets into the
+padded array (flat_offsets), and the vectorized sweeps read their shifted
+neighbors straight from it. The ghost cells hold
+
+- periodic: the cells of the opposite edge, the lattice wraps around
+- reflecting: the edge cells themselves, mirrored at the edge
+- fixed: EMPTY, forever
+
+and are updated whenever an edge cell changes (Lattice.set, fill_ghosts).
+Only the axes a neighborhood reaches along get ghost copies, e.g. not the
+single row (or column) of a one dimensional lattice.
+"""
+import numpy as np
+
+from species import EMPTY
+
+PERIODIC = "periodic"
+REFLECTING = "reflecting"
+FIXED = "fixed"
+BOUNDARIES = (PERIODIC, REFLECTING, FIXED)
+
+
+def pad(lattice):
+    """
+    :param lattice: 2d array of species ids
+    :return: a copy of lattice with a margin of one EMPTY cell
+    """
+    padded = np.full((lattice.shape[0] + 2, lattice.shape[1] + 2), EMPTY, dtype=lattice.dtype)
+    padded[1:-1, 1:-1] = lattice
+    return padded
+
+
+def ghost_sources(n, boundary, reach=True):
+    """
+    :param n: length of an axis
+    :param reach: whether neighborhoods reach along the axis
+    :return: (low, high): the indices whose cells the ghost cells before
+        the first and after the last index copy, -1 for none (they stay
+        EMPTY)
+    """
+    if boundary not in BOUNDARIES:
+        raise ValueError("unknown boundary %r" % (boundary,))
+    if boundary == FIXED or not reach:
+        return -1, -1
+    if boundary == PERIODIC:
+        return n - 1, 0
+    return 0, n - 1
+
+
+def ghost_indices(k, n, sources):
+    """
+    :param k: index along an axis of length n
+    :param sources: ghost_sources of the axis
+    :return: padded indices of the cell at index k and of its ghost copies
+    """
+    low, high = sources
+    return (k + 1,) + ((0,) if k == low else ()) + ((n + 1,) if k == high else ())
+
+
+def flat_offsets(offsets, shape):
+    """
+    :param offsets: (row, column) offsets of a neighborhood
+    :param shape: shape of the padded lattice
+    :return: the offsets as offsets of flat indices into the padded lattice
+    """
+    return np.array([di * shape[1] + dj for di, dj in offsets], dtype=np.intp)
+
+
+def fill_ghosts(padded, row_sources, col_sources, rows=None, cols=None):
+    """
+    copies the cells in rows x cols to their ghost cells
+
+    :param padded: padded lattice
+    :param row_sources: ghost_sources of the rows
+    :param col_sources: ghost_sources of the columns
+    :param rows: (start, stop) of the rows, default all (e.g. a worker's band)
+    :param cols: (start, stop) of the columns, default all
+    """
+    x, y = padded.shape[0] - 2, padded.shape[1] - 2
+    r0, r1 = rows or (0, x)
+    c0, c1 = cols or (0, y)
+    ghost_rows = [slice(r0 + 1, r1 + 1)]
+    for source, ghost in zip(row_sources, (0, x + 1)):
+        if r0 <= source < r1:
+            padded[ghost, c0 + 1:c1 + 1] = padded[source + 1, c0 + 1:c1 + 1]
+            ghost_rows.append(ghost)
+    # along the ghost rows too, for the corners
+    for source, ghost in zip(col_sources, (0, y + 1)):
+        if c0 <= source < c1:
+            for r in ghost_rows:
+                padded[r, ghost] = padded[r, source + 1]
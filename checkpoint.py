@@ -0,0 +1,47 @@
+"""
+Checkpoint files of a Lattice.
+
+A checkpoint at path P is three files:
+
+    P.npy   the lattice array, memory-mapped when loaded
+    P.npz   per-species tables and the unused part of the random stream
+    P.json  parameters, generation, counts and random generator state
+
+Each file is written under a temporary name and then renamed, the json
+last, so an interrupted save leaves the previous checkpoint readable.
+"""
+import json
+import os
+
+import numpy as np
+
+
+def write_checkpoint(path, state):
+    """
+    :param path: checkpoint path without extension
+    :param state: dict as returned by Lattice.checkpoint_state
+    """
+    tables = {name: value for name, value in state["tables"].items() if value is not None}
+    with open(path + ".npy.tmp", "wb") as f:
+        np.save(f, state["lattice"])
+    with open(path + ".npz.tmp", "wb") as f:
+        np.savez(f, **tables)
+    with open(path + ".json.tmp", "w") as f:
+        json.dump(state["meta"], f, indent=2)
+    for ext in (".npy", ".npz", ".json"):
+        os.replace(path + ext + ".tmp", path + ext)
+
+
+def read_checkpoint(path, mmap_mode="c"):
+    """
+    :param path: checkpoint path without extension
+    :param mmap_mode: how to map the lattice array, see numpy.load. The
+        default "c" (copy-on-write) never modifies the checkpoint file.
+    :return: (meta, lattice, tables)
+    """
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    lattice = np.load(path + ".npy", mmap_mode=mmap_mode)
+    with np.load(path + ".npz") as f:
+        tables = {name: f[name] for name in f.files}
+    return meta, lattice, tables
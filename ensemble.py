@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Headless parameter sweeps.
+
+Runs a Lattice for every point of a cartesian grid of parameters and every
+seed, fanned out over a process pool, and appends one JSON line per run to
+a results file. Runs already in the results file are skipped, so an
+interrupted sweep resumes where it stopped.
+
+Example spec:
+
+    {
+        "params": {"size": 100, "onlyRedBlue": true},
+        "grid": {"slider": [0, 0.1, 0.2], "redAdvantage": [1, 1.5]},
+        "seeds": [1, 2, 3],
+        "evolutions": 1000000,
+        "sweep": false,
+        "steadyWindow": 20
+    }
+
+"params" and "grid" keys are Lattice keyword arguments. Instead of "seeds",
+"replicates": n uses seeds 0..n-1. Every grid point runs with the same
+seeds.
+
+Runs stop early in absorbing states unless "earlyStop" is false, and in a
+steady state if "steadyWindow" (and optionally "steadyTolerance") is
+given, see termination.py. The row records why in "stop_reason" (null if
+the run used all its evolutions).
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+
+from lattice import Lattice
+from species import EMPTY
+from termination import Termination
+
+
+def run_key(params, seed):
+    return json.dumps([params, seed], sort_keys=True)
+
+
+def expand(spec):
+    """
+    lists the runs of a sweep spec
+    :param spec: dict
+    :return: list of (params, seed)
+    """
+    grid = spec.get("grid", {})
+    names = sorted(grid)
+    seeds = spec["seeds"] if "seeds" in spec else list(range(spec.get("replicates", 1)))
+    runs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(spec.get("params", {}))
+        params.update(zip(names, values))
+        runs.extend((params, seed) for seed in seeds)
+    return runs
+
+
+def completed(path):
+    """
+    keys of the runs already in a results file. A partly written last line
+    (e.g. after a crash) is ignored.
+    """
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                done.add(run_key(row["params"], row["seed"]))
+    return done
+
+
+def evolve(lattice, evolutions, sweep=False, termination=None, chunk=None):
+    """
+    evolves the lattice until it reaches the given generation, until
+    nothing can change any more (activeSites) or until termination says to
+    stop
+    :param termination: Termination, checked every chunk updates (default
+        once per lattice's worth of updates), or None to never stop early
+    :return: why the run stopped early, or None
+    """
+    chunk = chunk or lattice.n_sites
+    while lattice.generation < evolutions:
+        if lattice.active is not None:
+            # nothing can change any more, even with the early stops off
+            lattice.update_neighbors()
+            if not lattice.active:
+                return "no active sites"
+        if termination is not None:
+            reason = termination.check(lattice)
+            if reason is not None:
+                return reason
+        if sweep:
+            lattice.evolve_sweep(1)
+        else:
+            lattice.evolve(min(chunk, evolutions - lattice.generation))
+    return None
+
+
+def run(task):
+    """
+    runs one point of the sweep (in a pool worker)
+    :param task: (params, seed, evolutions, sweep, termination)
+    :return: result row
+    """
+    params, seed, evolutions, sweep, termination = task
+    t0 = time.perf_counter()
+    lattice = Lattice(seed=seed, **params)
+    t1 = time.perf_counter()
+    stop_reason = evolve(lattice, evolutions, sweep, Termination(**termination))
+    t2 = time.perf_counter()
+    return {
+        "params": params,
+        "seed": seed,
+        "generation": int(lattice.generation),
+        "counts": list(lattice.counts),
+        "empty": int(lattice.population[EMPTY]),
+        "stop_reason": stop_reason,
+        "init_time": t1 - t0,
+        "run_time": t2 - t1,
+        "updates_per_second": lattice.generation / (t2 - t1) if t2 > t1 else 0.0,
+    }
+
+
+def main():
+    args = parse_args()
+    with open(args.spec) as f:
+        spec = json.load(f)
+
+    done = completed(args.results)
+    termination = dict(absorbing=spec.get("earlyStop", True),
+                       window=spec.get("steadyWindow", 0),
+                       tolerance=spec.get("steadyTolerance", 0.001))
+    tasks = [(params, seed, spec["evolutions"], spec.get("sweep", False), termination)
+             for params, seed in expand(spec)
+             if run_key(params, seed) not in done]
+    print("%d runs, %d already done" % (len(tasks) + len(done), len(done)))
+
+    with open(args.results, "a+") as out, Pool(args.processes) as pool:
+        # terminate a partly written last line
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        for n, row in enumerate(pool.imap_unordered(run, tasks), 1):
+            out.write(json.dumps(row) + "\n")
+            out.flush()
+            print("%d/%d %s seed=%d generation=%d counts=%s" % (
+                n, len(tasks), row["params"], row["seed"], row["generation"], row["counts"]))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless parameter sweep")
+    parser.add_argument("spec",
+                        help="JSON sweep spec")
+    parser.add_argument("results",
+                        help="JSON lines file the results are appended to")
+    parser.add_argument("-p", "--processes",
+                        type=int,
+                        help="Number of worker processes (default: number of cores)",
+                        default=None)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
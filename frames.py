@@ -0,0 +1,169 @@
+"""
+Frames handed from a simulation to a display.
+
+The simulation thread is the only one that touches the Lattice. At the
+display rate it publishes a frame: a copy of the species ids, its block
+sums for zoomed out views (see lod.py), plus the generation, counts and
+rule statistics. Only the tiles that changed since are copied and summed.
+A FrameBuffer holds two frames; the simulation
+copies into the back one and then, under the lock, makes it the front
+one. The display reads the front frame under the same lock, so it never
+sees a half written frame and the simulation only waits for the lock if
+the display is in the middle of reading.
+
+Frames can live in shared memory so the simulation can run in another
+process (see runner_process.py). The display only reads the part of a
+frame its view shows.
+"""
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from threading import Lock
+
+import numpy as np
+
+import lod
+from lattice import DIRTY_TILE_SHIFT
+from rule_stats import N_CODES
+from species import EMPTY
+
+# header fields, in order
+HEADER = ("sequence", "front", "generation", "red", "green", "blue", "empty")
+SEQUENCE, FRONT = 0, 1
+
+
+class FrameBuffer(object):
+
+    def __init__(self, shape, dtype, palette, lock=None, shared=False, name=None):
+        """
+        :param shape: shape of the lattice array
+
+        :param dtype: dtype of the lattice array
+
+        :param palette: array of the species' colors, see Lattice.palette
+
+        :param lock: lock guarding the front frame, optional. Defaults to a
+            threading.Lock; pass a multiprocessing.Lock to share the buffer
+            between processes.
+
+        :param shared: bool, optional
+            If True, create the frames in shared memory.
+
+        :param name: str, optional
+            Name of the shared memory of an existing FrameBuffer to attach to.
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.palette = palette
+        self.lock = Lock() if lock is None else lock
+        header_bytes = len(HEADER) * 8
+        stats_bytes = 3 * N_CODES * 8
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        # per level of block sums: (offset, shape, dtype) of both frames' sums
+        self.levels = {}
+        size = header_bytes + stats_bytes + 2 * frame_bytes
+        for k in lod.levels(self.shape):
+            size = -(-size // 8) * 8
+            shape = (2,) + lod.level_shape(self.shape, k)
+            dtype = np.dtype(lod.level_dtype(k))
+            self.levels[k] = (size, shape, dtype)
+            size += int(np.prod(shape)) * dtype.itemsize
+        self.shm = None
+        if shared or name is not None:
+            self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+            if name is not None:
+                # the creator unlinks it; don't let this process's resource
+                # tracker unlink it (again) at exit
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            buffer = self.shm.buf
+        else:
+            buffer = bytearray(size)
+        self.header = np.ndarray(len(HEADER), dtype=np.int64, buffer=buffer)
+        # see RuleStats.table, all zeros if the lattice is not instrumented
+        self.rule_stats = np.ndarray((3, N_CODES), dtype=np.int64, buffer=buffer,
+                                     offset=header_bytes)
+        self.frames = np.ndarray((2,) + self.shape, dtype=self.dtype, buffer=buffer,
+                                 offset=header_bytes + stats_bytes)
+        self.sums = {k: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+                     for k, (offset, shape, dtype) in self.levels.items()}
+        if name is None:
+            self.header[...] = 0
+            self.rule_stats[...] = 0
+        # per frame: tiles that changed since the frame was last written
+        self.stale = None
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def publish(self, lattice):
+        """
+        copies the lattice into the back frame and makes it the front
+        frame. Called from the thread that evolves the lattice. Only the
+        tiles changed since the back frame was written are copied and
+        summed (see Lattice.track_dirty and lod.update_sums).
+        """
+        if self.stale is None:
+            lattice.track_dirty()
+            self.stale = np.ones((2,) + lattice.dirty.shape, dtype=bool)
+        rows, cols = lattice.take_dirty_tiles()
+        self.stale[:, rows, cols] = True
+        back = 1 - self.header[FRONT]
+        stale = self.stale[back]
+        frame = self.frames[back]
+        if np.count_nonzero(stale) > stale.size // 2:
+            np.copyto(frame, lattice.lattice)
+        else:
+            tile = 1 << DIRTY_TILE_SHIFT
+            for ti, tj in zip(*np.nonzero(stale)):
+                block = (slice(ti * tile, (ti + 1) * tile), slice(tj * tile, (tj + 1) * tile))
+                frame[block] = lattice.lattice[block]
+        self.update_sums(back, stale)
+        stale[...] = False
+        red, green, blue = lattice.counts
+        rule_stats = lattice.stats.table() if lattice.stats is not None else None
+        with self.lock:
+            self.header[FRONT] = back
+            self.header[2:] = (lattice.generation, red, green, blue,
+                               lattice.population[EMPTY])
+            if rule_stats is not None:
+                self.rule_stats[...] = rule_stats
+            self.header[SEQUENCE] += 1
+
+    def update_sums(self, back, stale):
+        """
+        updates the block sums of the back frame where tiles are stale, a
+        run of stale tiles in a row of tiles at a time
+        """
+        tile = 1 << DIRTY_TILE_SHIFT
+        regions = []
+        for ti in np.flatnonzero(stale.any(axis=1)):
+            cols = np.flatnonzero(stale[ti])
+            rows = (ti * tile, min((ti + 1) * tile, self.shape[0]))
+            for run in np.split(cols, np.flatnonzero(np.diff(cols) > 1) + 1):
+                regions.append((rows, (run[0] * tile, min((run[-1] + 1) * tile, self.shape[1]))))
+        lod.update_sums({k: s[back] for k, s in self.sums.items()}, self.frames[back],
+                        self.palette, regions, tile)
+
+    @contextmanager
+    def latest(self):
+        """
+        holds the lock while the caller reads the front frame. Keep the
+        with block short, the simulation waits for it when publishing.
+
+        :return: (info, frame, sums): dict of the header fields (and
+            "rule_stats"), the frame array and its block sums, see
+            lod.update_sums
+        """
+        with self.lock:
+            info = dict(zip(HEADER, self.header.tolist()))
+            info["rule_stats"] = self.rule_stats.copy()
+            front = info["front"]
+            yield info, self.frames[front], {k: s[front] for k, s in self.sums.items()}
+
+    def close(self, unlink=False):
+        if self.shm is None:
+            return
+        del self.header, self.rule_stats, self.frames, self.sums
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
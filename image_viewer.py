@@ -1,27 +1,49 @@
 import pygame
 
+import lod
 from MovingAverageWithRate import MovingAverageWithRate
+from rule_stats import format_summary
 
 BG_COLOR = (20, 20, 20)
 FONT_NAME = "font/RobotoMono-Regular.ttf"
 FONT_SIZE = 12
 TEXT_COLOR = (200, 200, 200)
+# largest default view, in pixels per side
+MAX_VIEW_SIZE = 800
+# smallest default view, so thin (e.g. one dimensional) lattices can be
+# zoomed in to fill it
+MIN_VIEW_SIZE = lod.MAX_MAGNIFICATION
 
 
 class ImageViewer(object):
-    def __init__(self, width, height, runner, border=50,
+    """
+    Shows the frames a runner publishes (see frames.py) in a zoomable view:
+    mouse wheel or +/- to zoom, drag or arrow keys to pan, 0 to show the
+    whole lattice again. Only the visible part of the lattice is rendered,
+    see lod.py. Lattice rows are shown as rows of pixels.
+    """
+
+    def __init__(self, runner, width=None, height=None, border=50,
                  updateRate=60,
                  caption=None,
                  autoStop=False):
-
+        """
+        :param width: width of the view in pixels. Default: the lattice's,
+            within MIN_VIEW_SIZE and MAX_VIEW_SIZE
+        :param height: height of the view in pixels, see width
+        """
         pygame.init()
-        self.width = width
-        self.height = height
         self.runner = runner
+        self.frames = runner.frames
+        # (columns, rows): the view works on the transposed frames, whose
+        # first axis is horizontal like pygame's
+        self.shape = shape = self.frames.shape[::-1]
+        self.width = width or min(max(shape[0], MIN_VIEW_SIZE), MAX_VIEW_SIZE)
+        self.height = height or min(max(shape[1], MIN_VIEW_SIZE), MAX_VIEW_SIZE)
         self.border = border
         self.updateRate = updateRate
         self.screen = pygame.display.set_mode(
-            (width + (2 * border), height + (2 * border)),
+            (self.width + (2 * border), self.height + (2 * border)),
             pygame.HWSURFACE | pygame.DOUBLEBUF)
 
         pygame.display.set_caption(self.caption)
@@ -33,26 +55,104 @@ class ImageViewer(object):
         self.autoStop = autoStop
         self.fps = MovingAverageWithRate(1000)
 
-        runner.lattice.surface = pygame.surfarray.make_surface(runner.lattice.rgb_image)
+        # sites per pixel and the first visible site (column, row)
+        self.fit = lod.fit_spp(shape, self.width, self.height)
+        self.spp = self.fit
+        self.origin = (0, 0)
+        self.surface = None
+        # header of the frame on screen
+        self.info = None
+        # redraw even if there is no new frame, e.g. after zooming
+        self.view_changed = True
+        # rule statistics overlay (if the lattice is instrumented), toggled with S
+        self.show_rule_stats = True
 
         # clear screen
         self.screen.fill(BG_COLOR)
 
-    @property
-    def lattice(self):
-        return self.runner.lattice
+    def redraw(self):
+        """
+        draws the visible part of the latest frame the simulation published,
+        if it is new or the view changed. The lattice itself is never read
+        here, see frames.py.
+        """
+        with self.frames.latest() as (info, frame, sums):
+            if not self.view_changed and self.info is not None \
+                    and info["sequence"] == self.info["sequence"]:
+                return
+            # transposed, see shape
+            sums = {k: s.swapaxes(0, 1) for k, s in sums.items()}
+            rgb = lod.decimate(frame.T, sums, self.frames.palette, self.origin, self.spp,
+                               self.width, self.height)
+        self.info = info
+        self.view_changed = False
+        self.surface = pygame.surfarray.make_surface(rgb)
+
+    def zoom(self, zoom_in, pixel=None):
+        """
+        zooms in or out by a factor 2, keeping the site under pixel (default:
+        the centre of the view) in place
+        :param pixel: (x, y) in view coordinates
+        """
+        px, py = pixel if pixel is not None else (self.width // 2, self.height // 2)
+        i = self.origin[0] + px * self.spp
+        j = self.origin[1] + py * self.spp
+        self.spp = lod.zoom_in(self.spp) if zoom_in else lod.zoom_out(self.spp, self.fit)
+        self.pan_to((i - px * self.spp, j - py * self.spp))
+
+    def pan(self, dx, dy):
+        """
+        moves the view by (dx, dy) pixels
+        """
+        self.pan_to((self.origin[0] + dx * self.spp, self.origin[1] + dy * self.spp))
+
+    def pan_to(self, origin):
+        self.origin = lod.clamp_origin(self.shape, origin, self.spp,
+                                       self.width, self.height)
+        self.view_changed = True
+
+    def reset_view(self):
+        self.spp = self.fit
+        self.pan_to((0, 0))
+
+    def handle_view_event(self, event):
+        """
+        zoom and pan with the mouse and keyboard
+        """
+        if event.type == pygame.MOUSEWHEEL and event.y:
+            x, y = pygame.mouse.get_pos()
+            self.zoom(event.y > 0, (x - self.border, y - self.border))
+        elif event.type == pygame.MOUSEMOTION and event.buttons[0]:
+            self.pan(-event.rel[0], -event.rel[1])
+        elif event.type == pygame.KEYDOWN:
+            step = self.width // 4
+            if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                self.zoom(True)
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.zoom(False)
+            elif event.key == pygame.K_0:
+                self.reset_view()
+            elif event.key == pygame.K_LEFT:
+                self.pan(-step, 0)
+            elif event.key == pygame.K_RIGHT:
+                self.pan(step, 0)
+            elif event.key == pygame.K_UP:
+                self.pan(0, -step)
+            elif event.key == pygame.K_DOWN:
+                self.pan(0, step)
 
     @property
     def caption(self):
-        l = self.lattice
+        p = self.runner.params
+        x, y = self.shape
         return "size={:}x{:} {:} slider={:} density={:} ratio={:} adv={:},{:} {:} growth={:},{:}".format(
-            l.x, l.y,
-            "rb!" if l.onlyRedBlue else "",
-            l.slider,
-            l.density, l.numRatio,
-            l.redAdvantage, l.blueAdvantage,
-            "defective" if l.defKillers else "",
-            l.redGrowth, l.blueGrowth
+            x, y,
+            "rb!" if p["onlyRedBlue"] else "",
+            p["slider"],
+            p["density"], p["numRatio"],
+            p["redAdvantage"], p["blueAdvantage"],
+            "defective" if p["defKillers"] else "",
+            p["redGrowth"], p["blueGrowth"]
         )
 
     def text(self, txt, bottom=False):
@@ -64,9 +164,19 @@ class ImageViewer(object):
         y += self.height + self.border if bottom else 0
         self.screen.blit(t, (x, y))
 
+    def overlay(self, lines):
+        """
+        draws lines of text over the top left corner of the lattice
+        """
+        y = self.border
+        for line in lines:
+            t = self.font.render(line, True, TEXT_COLOR, BG_COLOR)
+            self.screen.blit(t, (self.border, y))
+            y += t.get_height()
+
     def start(self):
         while not self.done:
-            if not self.runner.isAlive() and self.autoStop:
+            if not self.runner.is_alive() and self.autoStop:
                 pygame.quit()
                 return
 
@@ -77,24 +187,31 @@ class ImageViewer(object):
                     if event.key == pygame.K_ESCAPE:
                         pygame.quit()
                         return
-
-            lattice = self.runner.lattice
+                    elif event.key == pygame.K_s:
+                        self.show_rule_stats = not self.show_rule_stats
+                self.handle_view_event(event)
 
             self.screen.fill(BG_COLOR)
 
-            self.screen.blit(lattice.surface, (self.border, self.border))
+            self.redraw()
+            self.screen.blit(self.surface, (self.border, self.border))
+
+            info = self.info
+            if self.show_rule_stats and info["rule_stats"].any():
+                self.overlay(format_summary(info["rule_stats"]))
 
             x, fps = self.fps.add(1)
-            self.text("{:#7,} | {:.2f}fps".format(
-                lattice.generation, fps))
+            self.text("{:#7,} | {:.2f}fps | p99 frame {:.1f}ms | {}".format(
+                info["generation"], fps, self.fps.interval_percentile(99) / 1e6,
+                "zoom {:g}x".format(1 / self.spp) if self.spp < 1 else "1:{:g}".format(self.spp)))
 
-            total = lattice.x * lattice.y
-            ratio = 1 if lattice.counts[2] == 0 else lattice.counts[0] / lattice.counts[2]
+            total = self.frames.shape[0] * self.frames.shape[1]
+            ratio = 1 if info["blue"] == 0 else info["red"] / info["blue"]
             self.text("R:{:,} | B:{:,} | R/B:{:.3f} | Rest:{:.3f}".format(
-                lattice.counts[0],
-                lattice.counts[2],
+                info["red"],
+                info["blue"],
                 ratio,
-                (total - (lattice.counts[0] + lattice.counts[2])) / total),
+                (total - (info["red"] + info["blue"])) / total),
                 bottom=True)
 
             self.frame_count += 1
@@ -6,33 +6,50 @@ Created on Sat Dec  3 10:51:05 2016
 @author: dyanni3
 """
 # %% imports and prep
-from threading import Lock
+import math
 
 import numpy as np
-from numpy.random import rand as r
-from collections import defaultdict as d, defaultdict
 from PIL import Image
-from functools import reduce
 
-from util import int2color, int2color_tuple, count_colors, has_colors
+from active_sites import ActiveSites
+from backends import get_backend
+from boundary import PERIODIC, pad, ghost_sources, ghost_indices, flat_offsets, fill_ghosts
+from checkpoint import read_checkpoint, write_checkpoint
+from rule_stats import RuleStats, RANDOM_DEATH, KILL_RED, KILL_BLUE, KILL_ENEMIES, FILL, IDLE
+from sampling import RandomStream, split_uniform
+from species import EMPTY, RED, BLUE, RED_COLOR, BLUE_COLOR, MAX_SPECIES
+from sweep import Rules, geometry, sweep_phase
+from util import int2color, neighborhood_sum
 
-# RED = 0.2295
-# RED = 0.1841900
-# BLUE = 0.00254
-# BLUE = 0.01234
+# dirty tiles are (1 << DIRTY_TILE_SHIFT) sites square, see Lattice.track_dirty
+DIRTY_TILE_SHIFT = 6
 
-RED = 1.0 / float(0xe41a1c)
-BLUE = 1.0 / float(0x377eb8)
 
+class LatticeObserver(object):
+    """
+    Gets notified of changes to a Lattice, e.g. to render it.
+    Register with Lattice.add_observer().
+    """
 
-# BLUE = 1.0  / 0x4daf4a
+    def cell_changed(self, lattice, i, j, old, new):
+        """
+        called by Lattice.set after site (i,j) changed from species old to new
+        """
+        pass
+
+    def lattice_changed(self, lattice):
+        """
+        called after the lattice was modified in bulk (e.g. by evolve_sweep)
+        """
+        pass
 
 
 class Lattice(object):
     def __init__(self, size=100, slider=0, onlyRedBlue=False,
                  redAdvantage=1, blueAdvantage=1, defKillers=False, density=1,
                  numRatio=1, redGrowth=1, blueGrowth=1, deathRate=100000000,
-                 antibioticDeath=1):
+                 antibioticDeath=1, activeSites=False, backend="python", seed=None,
+                 initial=None, boundary=PERIODIC):
         """
 
         :type slider: float, optional
@@ -44,8 +61,9 @@ class Lattice(object):
 
         :type size: int or tuple of ints, optional
         Size of the lattice. If the given size is an int, the lattice is assumed to be
-        square, i.e. size=[value, value]. For a non-square lattice, use size=[x,y]. Defaults
-        to 100 for [100,100] lattice.
+        square, i.e. size=[value, value]. For a non-square lattice, use size=[width, height]
+        (columns, rows); size=[n, 1] (or [1, n]) is a one dimensional lattice of n sites,
+        whose neighborhoods are the sites left and right (above and below). Defaults to 100 for [100,100] lattice.
 
         :type redAdvantage: float, optional
         killing disparity, 1 means equal killers. Defaults to 1
@@ -69,6 +87,30 @@ class Lattice(object):
         :type numRatio: float, optional
         overall number ratio (number of blue/ total number of cells). Default 1
 
+        :type activeSites: bool, optional
+        if true, only sites with at least one neighbor of a different species
+        (enemy or empty) are sampled; all other sites cannot change. The
+        generation still advances by the number of uniformly sampled steps
+        this stands for. Requires onlyRedBlue. Defaults to False
+
+        :type backend: str, optional
+        engine behind evolve(): "python" or "numba" (compiled, falls back to
+        "python" if numba is not installed). See backends.py. Defaults to "python"
+
+        :type seed: int or np.random.SeedSequence, optional
+        seed of the lattice's random number generator, which drives both the
+        initial lattice and its evolution. Use spawn() to derive independent
+        seeds for parallel or ensemble runs. Defaults to None (fresh entropy)
+
+        :type initial: tuple, optional
+        (lattice, kill_table, palette) to start from instead of a random
+        lattice, e.g. from a checkpoint. Defaults to None
+
+        :type boundary: str, optional
+        what lies beyond the edges of the lattice: "periodic" (it wraps
+        around), "reflecting" (the edge cells, mirrored) or "fixed" (empty
+        cells that never change). See boundary.py. Defaults to "periodic"
+
         """
         self.onlyRedBlue = onlyRedBlue
         self.slider = slider
@@ -80,47 +122,103 @@ class Lattice(object):
         self.density = density
         self.numRatio = numRatio
         self.size = size
+        self.boundary = boundary
         self.generation = 0
-        self.lock = Lock()
-        self.surface = None
-        self.counts = (0, 0, 0)  # number of red, blue, green pixels
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) \
+            else np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+        # block-buffered uniforms for the single site update loop
+        self.stream = RandomStream(self.rng)
+        self.observers = []
+        # per-rule counters of evolve_python, see instrument
+        self.stats = None
+        self.rgb_image = None
+        # tiles changed since a renderer last looked, see track_dirty
+        self.dirty = None
 
         try:
             self.x, self.y = size[1], size[0]
         except TypeError:
             self.x, self.y = size, size
 
-        self.rgb_image = np.empty((self.x, self.y, 3), dtype=np.uint8)
+        self.n_sites = self.x * self.y
+        # the neighborhood, as offsets and as flat offsets into padded
+        self.offsets = geometry((self.x, self.y))[0]
+        self.flat_offsets = flat_offsets(self.offsets, (self.x + 2, self.y + 2))
+        # the rows and the columns the ghost cells copy, see boundary.py
+        self.row_sources = ghost_sources(self.x, boundary,
+                                         reach=any(di for di, dj in self.offsets))
+        self.col_sources = ghost_sources(self.y, boundary,
+                                         reach=any(dj for di, dj in self.offsets))
 
         # if defective killers set to true then there's no random death either
         # (no killing, no random death)
         if defKillers:
             self.slider = 0
 
-        self.lattice, self.killdict = self.create_red_blue_lattice(density, numRatio) \
+        lattice, self.kill_table, self.palette = \
+            initial if initial is not None else \
+            self.create_red_blue_lattice(density, numRatio) \
             if onlyRedBlue else \
             self.create_other_lattice(density)
-
-        self.to_rgb_image()
+        # the lattice with a margin of ghost cells, and views of it
+        self.padded = self.lattice = self.flat = None
+        self.attach(pad(lattice))
+        self.fill_ghosts()
+
+        # number of sites occupied by each species, indexed by species id
+        self.population = None
+        self.count_population()
+        # which of the r, g, b channels of each species' color are "lit"
+        self.channels = (self.palette > 100).astype(np.int64)
+        # red/blue mode: number of empty, red and blue cells in every site's
+        # neighborhood (indexed [species, i, j]), kept up to date by set()
+        # in flat_neighbors (indexed [species, padded flat index])
+        self.neighbors = self.flat_neighbors = None
+        # any color mode: sum of the killing effectiveness of the cells in
+        # every site's neighborhood, the same way
+        self.kill_sums = self.flat_kill_sums = None
+        # whether the lattice was modified in bulk since the neighbor counts
+        # (and active sites) were computed, see refresh
+        self.stale = False
+        self.count_neighbors()
+
+        self.backend = get_backend(backend, self.rng)
+
+        # sites that can change, see activeSites
+        self.active = None
+        if activeSites:
+            if not onlyRedBlue:
+                raise ValueError("activeSites requires onlyRedBlue")
+            if self.backend.name == "numba":
+                raise ValueError("the numba backend does not support activeSites")
+            self.find_active_sites()
 
     def create_other_lattice(self, density):
         """
         initialize the lattice with a bunch of different types of cells
-        (represented as different colors)
+        (represented as different species ids, each with its own color).
+        Every cell gets its own species unless the lattice has more than
+        MAX_SPECIES cells, in which case species are drawn at random.
         :param density:
+        :return: lattice, kill_table, palette
         """
-        lattice = r(self.x, self.y)
+        n_cells = self.x * self.y
+        n_species = min(n_cells, MAX_SPECIES)
+        if n_cells <= MAX_SPECIES:
+            lattice = self.rng.permutation(n_cells) + 1
+        else:
+            lattice = self.rng.integers(1, n_species + 1, size=n_cells)
+        lattice = lattice.astype(np.uint16).reshape(self.x, self.y)
         if density != 1:
-            for bug in np.ravel(lattice):
-                if r() > density:
-                    lattice[lattice == bug] = 0
-        # killdict is a hashtable containing the killing effectiveness for each color
-        killdict = d(list)  # type: defaultdict[Any, float]
-        killdict[0] = 0
-        for color in np.ravel(lattice):
-            killdict[color] = r()
-        killdict[0] = 0
-        return lattice, killdict
+            # every cell independently stays occupied with probability density
+            lattice[self.rng.random((self.x, self.y)) > density] = EMPTY
+        # kill_table holds the killing effectiveness of each species
+        kill_table = self.rng.random(n_species + 1)
+        kill_table[EMPTY] = 0
+        palette = self.rng.integers(0, 256, size=(n_species + 1, 3), dtype=np.uint8)
+        palette[EMPTY] = 0
+        return lattice, kill_table, palette
 
     def create_red_blue_lattice(self, density, numRatio):
         """
@@ -128,97 +226,342 @@ class Lattice(object):
         chosen randomly according to numRatio and density
         :param density:
         :param numRatio:
-        :return:
+        :return: lattice, kill_table, palette
         """
+        palette = np.array([int2color(0), int2color(RED_COLOR), int2color(BLUE_COLOR)],
+                           dtype=np.uint8)
         try:
             if density != 1:
-                return np.random.choice(
-                    [0, RED, BLUE],
+                lattice = self.rng.choice(
+                    [EMPTY, RED, BLUE],
                     p=[1.0 - density, density * (1.0 - numRatio), density * numRatio],
-                    size=(self.x, self.y)), None
+                    size=(self.x, self.y))
             else:
-                return np.random.choice([RED, BLUE], size=(self.x, self.y)), None
+                lattice = self.rng.choice([RED, BLUE], size=(self.x, self.y))
         except ValueError:
             print("ERROR: Density should be an integer or float")
             exit(-1)
+        return lattice.astype(np.uint8), None, palette
+
+    def attach(self, padded):
+        """
+        makes padded (a lattice with its margin of ghost cells, see
+        boundary.py) the storage of the lattice, e.g. to share it with
+        other processes
+        """
+        self.padded = padded
+        self.lattice = padded[1:-1, 1:-1]
+        self.flat = padded.reshape(-1)
+
+    def fill_ghosts(self):
+        """
+        updates all ghost cells after the lattice was modified in bulk
+        """
+        fill_ghosts(self.padded, self.row_sources, self.col_sources)
+
+    def cell(self, i, j):
+        """
+        :return: flat index of site (i,j) in padded
+        """
+        return (i + 1) * (self.y + 2) + j + 1
 
     def set(self, i, j, value):
         """
-        Sets lattice value at pixel (i,j). Also updates rgb_image(i,j)
-        as well as red/blue counts.
+        Sets lattice value at pixel (i,j) and its ghost copies. Also
+        updates the species population and neighbor counts, and notifies
+        the observers.
         :param i:
         :param j:
-        :param value:
-        """
-        self.lattice[i, j] = value
-        prev = has_colors(self.rgb_image[i, j])
-        color = self.rgb_image[i, j] = int2color(value)
-        self.surface.set_at((i, j), color)
-        x = has_colors(self.rgb_image[i, j])
-        c = self.counts
-        self.counts = (c[0] + x[0] - prev[0],
-                       c[1] + x[1] - prev[1],
-                       c[2] + x[2] - prev[2])
+        :param value: species id
+        """
+        if self.stale:
+            self.update_neighbors()
+        cell = self.cell(i, j)
+        old = self.flat.item(cell)
+        self.population[old] -= 1
+        self.population[value] += 1
+        if i in self.row_sources or j in self.col_sources:
+            stride = self.y + 2
+            cells = [a * stride + b for a in ghost_indices(i, self.x, self.row_sources)
+                     for b in ghost_indices(j, self.y, self.col_sources)]
+            self.flat[cells] = value
+            # the sites whose neighborhoods hold the cell, some of them more
+            # than once; those off the lattice wrap into the margin
+            sites = np.subtract.outer(cells, self.flat_offsets).ravel() % self.flat.size
+            add = np.add.at
+        else:
+            self.flat[cell] = value
+            sites = cell - self.flat_offsets
+            add = None
+        if self.neighbors is not None:
+            if add is None:
+                self.flat_neighbors[old, sites] -= 1
+                self.flat_neighbors[value, sites] += 1
+            else:
+                add(self.flat_neighbors[old], sites, -1)
+                add(self.flat_neighbors[value], sites, 1)
+        elif self.kill_sums is not None:
+            change = self.kill_table[value] - self.kill_table[old]
+            if add is None:
+                self.flat_kill_sums[sites] += change
+            else:
+                add(self.flat_kill_sums, sites, change)
+        if self.active is not None:
+            self.update_active_sites(sites)
+        if self.dirty is not None:
+            self.dirty[i >> DIRTY_TILE_SHIFT, j >> DIRTY_TILE_SHIFT] = True
+        for observer in self.observers:
+            observer.cell_changed(self, i, j, old, value)
+
+    def track_dirty(self):
+        """
+        starts recording which tiles of the lattice change, for renderers
+        that redraw only what changed. dirty[ti, tj] covers sites
+        (ti << DIRTY_TILE_SHIFT, tj << DIRTY_TILE_SHIFT) onwards. All tiles
+        start dirty.
+        """
+        tile = 1 << DIRTY_TILE_SHIFT
+        self.dirty = np.ones((-(-self.x // tile), -(-self.y // tile)), dtype=bool)
+
+    def take_dirty_tiles(self):
+        """
+        clears the dirty tiles and returns them. Safe to call while another
+        thread evolves the lattice, as long as the tiles' sites are read
+        after this returns.
+        :return: (rows, cols) arrays of tile indices
+        """
+        rows, cols = np.nonzero(self.dirty)
+        self.dirty[rows, cols] = False
+        return rows, cols
+
+    def add_observer(self, observer):
+        """
+        :param observer: LatticeObserver
+        """
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    @property
+    def counts(self):
+        """
+        number of sites whose color has a lit red, green and blue channel
+        (i.e. red, -, blue cells in red/blue mode)
+        """
+        return tuple(int(c) for c in self.population @ self.channels)
 
     def evolve(self, n_steps=1):
         """
         main function, moves the lattice forward n steps in time
+        using the lattice's backend
 
         :param n_steps:
         """
-        for t in range(n_steps):
-            self.generation += 1
+        self.backend.evolve(self, n_steps)
 
-            # pick lattice site
-            i, j = self.random_site
-
-            # random death happens if slider>random float in [0,1]
-            if self.slider > r():
-                self.random_death(i, j)
+    def evolve_python(self, n_steps=1):
+        """
+        the "python" backend: one random site per iteration
 
-            # else killing/filling a la IBM happens
-            else:
-                n_blue, n_enemy, n_red, neighborhood = \
-                    self.get_neighborhood(i, j)
+        :param n_steps:
+        """
+        if self.stats is not None:
+            self.stats.evolve(self.step, n_steps)
+            return
+        step = self.step
+        for t in range(n_steps):
+            if step() is None:
+                return
 
-                # site is filled with red bact
-                if self.onlyRedBlue and self.is_red(i, j):
-                    self.kill_red(i, j, n_blue, self.thresh)
+    def instrument(self, sample_every=64):
+        """
+        starts counting what evolve_python does, per rule, and timing every
+        sample_every-th step. Only the python backend is instrumented.
+        :return: RuleStats
+        """
+        self.stats = RuleStats(sample_every)
+        return self.stats
 
-                # site is filled with a blue bacteria
-                elif self.onlyRedBlue and self.is_blue(i, j):
-                    self.kill_blue(i, j, n_red, self.thresh)
+    def step(self):
+        """
+        one single site update
 
-                elif n_enemy > 0 and not self.is_empty(i, j):
-                    if self.has_enough_enemies(i, j, neighborhood):
-                        self.kill(i, j)
+        :return: code of the rule applied, see rule_stats.py, or None if
+        nothing can change any more
+        """
+        if self.stale:
+            self.update_neighbors()
+        if self.active is None:
+            self.generation += 1
+        elif self.active:
+            # rejection-free: skip the steps that would have picked
+            # a site that cannot change
+            self.generation += self.skipped_steps(len(self.active) / self.n_sites)
+        else:
+            return None
+
+        # pick lattice site
+        i, j = self.random_site
+
+        # random death happens if slider>random float in [0,1]
+        if self.slider > self.stream.uniform():
+            self.random_death(i, j)
+            return 2 * RANDOM_DEATH + 1
+
+        # else killing/filling a la IBM happens
+        centre = self.lattice.item(i, j)
+        # site is filled with red bact
+        if self.onlyRedBlue and centre == RED:
+            return 2 * KILL_RED + self.kill_red(i, j, self.neighbors[BLUE, i, j], self.thresh)
+
+        # site is filled with a blue bacteria
+        if self.onlyRedBlue and centre == BLUE:
+            return 2 * KILL_BLUE + self.kill_blue(i, j, self.neighbors[RED, i, j], self.thresh)
+
+        if centre != EMPTY:
+            n_blue, n_enemy, n_red, neighborhood = \
+                self.get_neighborhood(i, j)
+
+            if n_enemy > 0:
+                if self.has_enough_enemies(i, j, neighborhood):
+                    self.kill(i, j)
+                    return 2 * KILL_ENEMIES + 1
+
+                # FILLING ....... #########
+                elif self.is_empty(i, j):
+                    if self.onlyRedBlue and n_red + n_blue > 0:
+                        return 2 * FILL + self.fill_red_or_blue(i, j, n_blue, n_red)
+
+                    elif n_enemy > 0:
+                        return 2 * FILL + self.fill_with_neighbor_color(i, j, neighborhood)
+                return 2 * KILL_ENEMIES
+        return 2 * IDLE
+
+    def evolve_sweep(self, n_sweeps=1):
+        """
+        moves the lattice forward by whole sweeps. Each sweep gives every
+        site sampled by evolve one update attempt, processed one sub-lattice
+        at a time with vectorized numpy (see sweep.py). The generation
+        advances by the number of sites updated.
 
-                    # FILLING ....... #########
-                    elif self.is_empty(i, j):
-                        if self.onlyRedBlue and n_red + n_blue > 0:
-                            self.fill_red_or_blue(i, j, n_blue, n_red)
+        :param n_sweeps:
+        """
+        rows, cols = (0, self.x), (0, self.y)
+        rules = self.rules
+        offsets, phases = geometry(self.lattice.shape, self.boundary)
+        for t in range(n_sweeps):
+            for k in self.rng.permutation(len(phases)):
+                self.generation += sweep_phase(self.padded, self.kill_table, rules,
+                                               self.rng, phases[k], rows, cols, offsets)
+                self.fill_ghosts()
+        self.refresh()
+
+    def refresh(self, population=True):
+        """
+        updates everything derived from the lattice after it has been
+        modified in bulk rather than through set(). The ghost cells must
+        be up to date already. The neighbor counts and active sites are
+        only recomputed once single site updates need them, see
+        update_neighbors.
+
+        :param population: recount the population too (False if the bulk
+            update kept it up to date)
+        """
+        if population:
+            self.count_population()
+        self.stale = True
+        if self.dirty is not None:
+            self.dirty[...] = True
+        for observer in self.observers:
+            observer.lattice_changed(self)
 
-                        elif n_enemy > 0:
-                            if not self.fill_with_neighbor_color(i, j, neighborhood):
-                                continue
+    @property
+    def rules(self):
+        return Rules(self.onlyRedBlue, self.slider, self.redAdvantage,
+                     self.blueAdvantage, self.defKillers, self.thresh)
 
     @property
     def thresh(self):
-        return 0.5 if self.x == 1 else 2
+        return 0.5 if self.x == 1 or self.y == 1 else 2
+
+    def count_population(self):
+        self.population = np.bincount(np.ravel(self.lattice),
+                                      minlength=len(self.palette))
+
+    def update_neighbors(self):
+        """
+        recomputes the neighbor counts and active sites if they are stale,
+        see refresh
+        """
+        if self.stale:
+            self.stale = False
+            self.count_neighbors()
+            if self.active is not None:
+                self.find_active_sites()
+
+    def count_neighbors(self):
+        """
+        (re)computes the red/blue mode neighbor counts (or the any color
+        mode kill sums) from scratch, ghost cells included
+        """
+        shape = self.padded.shape
+        if self.onlyRedBlue:
+            self.flat_neighbors = np.stack([
+                neighborhood_sum(self.padded == s, self.offsets).reshape(-1)
+                for s in (EMPTY, RED, BLUE)])
+            self.neighbors = self.flat_neighbors.reshape((-1,) + shape)[:, 1:-1, 1:-1]
+        elif self.kill_table is not None:
+            self.flat_kill_sums = neighborhood_sum(self.kill_table[self.padded],
+                                                   self.offsets).reshape(-1)
+            self.kill_sums = self.flat_kill_sums.reshape(shape)[1:-1, 1:-1]
+
+    def is_active(self, i, j):
+        """
+        whether the site has a neighbor of a different species (red/blue mode)
+        """
+        n = self.neighbors
+        return n[EMPTY, i, j] + n[RED, i, j] + n[BLUE, i, j] > n[self.lattice[i, j], i, j]
+
+    def find_active_sites(self):
+        """
+        (re)builds the set of active sites from the neighbor counts
+        """
+        same = np.take_along_axis(self.neighbors, self.lattice[None].astype(np.intp), 0)[0]
+        active = self.neighbors.sum(axis=0) > same
+        self.active = ActiveSites(self.lattice.size, np.flatnonzero(active))
+
+    def update_active_sites(self, sites):
+        """
+        updates the active state of sites after a cell in their
+        neighborhood changed
+        :param sites: flat indices into padded, see set
+        """
+        stride = self.y + 2
+        for site in set(sites.tolist()):
+            a, b = divmod(site, stride)
+            if 0 < a <= self.x and 0 < b <= self.y:
+                a, b = a - 1, b - 1
+                if self.is_active(a, b):
+                    self.active.add(a * self.y + b)
+                else:
+                    self.active.remove(a * self.y + b)
 
     def get_neighborhood(self, i, j):
         # get the neighborhood of the ith,jth 'pixel'
-        neighborhood = self.lattice[i - 1:i + 2, j - 1:j + 2]
+        neighborhood = self.flat[self.cell(i, j) + self.flat_offsets]
         # find number of species one (red, RED),
-        # species two (blue, BLUE)
-        n_blue = np.size(neighborhood[neighborhood == BLUE])
-        n_red = np.size(neighborhood[neighborhood == RED])
+        # species two (blue, BLUE); only the red/blue rules use them
+        n_blue = n_red = 0
+        if self.onlyRedBlue:
+            n_blue = np.count_nonzero(neighborhood == BLUE)
+            n_red = np.count_nonzero(neighborhood == RED)
         # total number of differently colored cells in neighborhood
-        n_enemy = np.size(neighborhood[neighborhood != self.lattice[i, j]])
+        n_enemy = np.count_nonzero(neighborhood != self.lattice[i, j])
         return n_blue, n_enemy, n_red, neighborhood
 
     def is_empty(self, i, j):
-        return self.lattice[i, j] == 0
+        return self.lattice[i, j] == EMPTY
 
     def is_red(self, i, j):
         return self.lattice[i, j] == RED
@@ -227,39 +570,38 @@ class Lattice(object):
         return self.lattice[i, j] == BLUE
 
     def fill_red_or_blue(self, i, j, n_blue, n_red):
-        if ((n_red * self.redGrowth + n_blue * self.blueGrowth) * r()) > 2:
-            if n_red * self.redGrowth * r() > n_blue * self.blueGrowth * r():
+        u = self.stream.uniform
+        if ((n_red * self.redGrowth + n_blue * self.blueGrowth) * u()) > 2:
+            if n_red * self.redGrowth * u() > n_blue * self.blueGrowth * u():
                 self.set(i, j, RED)
             else:
                 self.set(i, j, BLUE)
-        else:
-            self.kill(i, j)
+            return True
+        self.kill(i, j)
+        return False
 
     def fill_with_neighbor_color(self, i, j, neighborhood):
         # find all the other colors in neighborhood
-        choices = np.ravel(neighborhood[neighborhood != 0])
+        choices = neighborhood[neighborhood != EMPTY]
         # if no other cells in neighborhood then stay empty
         if choices.size == 0:
             self.kill(i, j)
             return False
 
         # fill with one of the other colors in neighborhood
-        # (according to number of cells)
-        choices = list(choices)
-        choices2 = [choice * (1 - self.killdict[choice]) for choice in choices]
-        choices2 = [choice / len(choices2) for choice in choices2]
-        zeroprob = 1 - sum(choices2)
-        choices2.append(zeroprob)
-        choices2 = np.array(choices2)
-        choices.append(0)
-        choices = np.array(choices)
-        self.set(i, j, np.random.choice(choices, p=choices2))
+        # (according to number of cells), weaker killers are more likely:
+        # the picked color fills the site with probability 1 - its kill
+        k, u = split_uniform(self.stream.uniform(), choices.size)
+        color = choices[k]
+        self.set(i, j, color if u < 1 - self.kill_table[color] else EMPTY)
         # self.lattice[i,j]=np.random.choice(np.ravel(neighborhood[neighborhood!=0]))
         return True
 
     def kill_blue(self, i, j, n_red, thresh):
-        if n_red * r() * self.redAdvantage > thresh and not self.defKillers:
-            self.set(i, j, 0)
+        if n_red * self.stream.uniform() * self.redAdvantage > thresh and not self.defKillers:
+            self.set(i, j, EMPTY)
+            return True
+        return False
 
     def kill_red(self, i, j, n_blue, thresh):
         """
@@ -269,57 +611,147 @@ class Lattice(object):
         :param j:
         :param n_blue:
         :param thresh:
+        :return: True if the red bacteria was killed
         """
-        if n_blue * r() * self.blueAdvantage > thresh and not self.defKillers:
+        if n_blue * self.stream.uniform() * self.blueAdvantage > thresh and not self.defKillers:
             self.kill(i, j)
+            return True
+        return False
 
     def has_enough_enemies(self, i, j, neighborhood):
-        return self.enemy_weight(i, j, neighborhood) * r() > 2
+        return self.enemy_weight(i, j, neighborhood) * self.stream.uniform() > 2
 
     def enemy_weight(self, i, j, neighborhood):
-        enemy_weight = 0
-        for enemy in np.ravel(neighborhood):
-            if enemy != 0 and enemy != self.lattice[i, j]:
-                try:
-                    enemy_weight += self.killdict[enemy]
-                except TypeError:
-                    print("ERROR")
-                    pass
-                    # enemy_weight=enemy_weight+self.killdict[enemy][0];
-        return enemy_weight
+        """
+        summed killing effectiveness of the neighbors of another species:
+        that of the whole neighborhood (kill_sums) minus that of the cells
+        of the site's own species. See sweep.enemy_weight for batches.
+        """
+        centre = self.lattice[i, j]
+        return self.kill_sums[i, j] - \
+            self.kill_table[centre] * np.count_nonzero(neighborhood == centre)
 
     def kill(self, i, j):
-        self.set(i, j, 0)
+        self.set(i, j, EMPTY)
 
     def random_death(self, i, j):
-        self.set(i, j, np.random.choice(np.ravel(
-            self.lattice[i - 1:i + 2, j - 1:j + 2])))
+        # replace with a random cell of the neighborhood
+        k = int(self.stream.uniform() * len(self.flat_offsets))
+        self.set(i, j, self.flat.item(self.cell(i, j) + self.flat_offsets.item(k)))
 
     @property
     def random_site(self):
-        try:
-            j = np.random.randint(1, self.y - 2)
-            i = np.random.randint(1, self.x - 2)
-        except ValueError:
-            # this will happen if you've chosen your lattice to be one dimensional
-            i = 0
-            j = np.random.randint(0, self.y - 1)
-        return i, j
+        if self.active is not None:
+            return divmod(int(self.active.sample(self.stream.uniform())), self.y)
+        return divmod(int(self.stream.uniform() * self.n_sites), self.y)
+
+    def skipped_steps(self, p):
+        """
+        number of uniformly sampled steps up to and including the first one
+        that hits an active site (geometric with success probability p)
+        """
+        if p >= 1:
+            return 1
+        return 1 + int(math.log(1.0 - self.stream.uniform()) / math.log(1.0 - p))
+
+    @property
+    def params(self):
+        """
+        constructor arguments that recreate this lattice's rules
+        """
+        return dict(size=self.size, slider=self.slider, onlyRedBlue=self.onlyRedBlue,
+                    redAdvantage=self.redAdvantage, blueAdvantage=self.blueAdvantage,
+                    defKillers=self.defKillers, density=self.density,
+                    numRatio=self.numRatio, redGrowth=self.redGrowth,
+                    blueGrowth=self.blueGrowth, activeSites=self.active is not None,
+                    backend=self.backend.name, boundary=self.boundary)
+
+    def checkpoint_state(self, copy=False):
+        """
+        everything needed to continue the simulation later, see checkpoint.py
+
+        :param copy: copy the lattice array, so the state stays valid while
+            the lattice keeps evolving (e.g. to write it from another thread)
+        :return: dict
+        """
+        if self.active is not None:
+            self.update_neighbors()
+        ss = self.seed_sequence
+        stream = self.stream
+        return {
+            "lattice": self.lattice.copy() if copy else self.lattice,
+            "tables": {
+                "kill_table": self.kill_table,
+                "palette": self.palette,
+                # uniforms drawn from rng but not used yet
+                "stream": np.array(stream.block[stream.position:]),
+                # in sampling order
+                "active": self.active.sites[:len(self.active)].copy()
+                if self.active is not None else None,
+            },
+            "meta": {
+                "params": self.params,
+                "generation": int(self.generation),
+                "counts": list(self.counts),
+                "seed": {"entropy": ss.entropy,
+                         "spawn_key": list(ss.spawn_key),
+                         "n_children_spawned": ss.n_children_spawned},
+                "rng": self.rng.bit_generator.state,
+            },
+        }
+
+    def save_checkpoint(self, path):
+        """
+        saves the lattice to path.npy, path.npz and path.json. Evolving the
+        restored lattice continues exactly where this one is now (python
+        engine)
+
+        :param path: checkpoint path without extension
+        """
+        write_checkpoint(path, self.checkpoint_state())
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """
+        restores a lattice saved by save_checkpoint. The lattice array is
+        read from the memory-mapped .npy, the checkpoint files are not
+        modified.
+
+        :param path: checkpoint path without extension
+        :return: Lattice
+        """
+        meta, lattice, tables = read_checkpoint(path)
+        seed = meta["seed"]
+        seed_sequence = np.random.SeedSequence(seed["entropy"],
+                                               spawn_key=seed["spawn_key"],
+                                               n_children_spawned=seed["n_children_spawned"])
+        restored = cls(seed=seed_sequence,
+                       initial=(lattice, tables.get("kill_table"), tables["palette"]),
+                       **meta["params"])
+        restored.generation = meta["generation"]
+        restored.rng.bit_generator.state = meta["rng"]
+        restored.stream.block = tables["stream"].tolist()
+        restored.stream.position = 0
+        if "active" in tables:
+            restored.active = ActiveSites(restored.lattice.size, tables["active"])
+        return restored
+
+    def spawn(self, n):
+        """
+        :return: n independent child seeds of this lattice's seed, e.g. for
+        worker processes
+        """
+        return self.seed_sequence.spawn(n)
 
     def to_rgb_image(self):
         """
-        Convert lattice to a list of RGB tuples
+        Convert lattice to an RGB array by looking up each species' color
+        in the palette
 
         """
-        r, g, b = (0, 0, 0)
-        # img = np.empty((self.x, self.y, 3), dtype=np.uint8)
-        for i in range(self.x):
-            for j in range(self.y):
-                x = self.lattice[i, j]
-                self.rgb_image[i, j] = int2color(x)
-                r += 1 if x == RED else 0
-                b += 1 if x == BLUE else 0
-        self.counts = (r, g, b)
+        if self.rgb_image is None:
+            self.rgb_image = np.empty((self.x, self.y, 3), dtype=np.uint8)
+        np.take(self.palette, self.lattice, axis=0, out=self.rgb_image)
         return self.rgb_image
 
     def view(self):
@@ -329,13 +761,8 @@ class Lattice(object):
         :return:
         RGB image of the lattice
         """
-        lu = list(map(int2color_tuple, np.ravel(self.lattice[:, :])))
-        imu = Image.new('RGB', [self.lattice.shape[1], self.lattice.shape[0]])
-        imu.putdata(lu)
-
-        print(reduce(count_colors, lu, [0, 0, 0]))
+        imu = Image.fromarray(np.take(self.palette, self.lattice, axis=0))
 
-        if not self.onlyRedBlue:
-            return imu
+        print(list(self.counts))
 
         return imu
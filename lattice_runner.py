@@ -1,7 +1,14 @@
+import cProfile
 import time
 from threading import Thread
 
+from checkpoint import write_checkpoint
+from frames import FrameBuffer
 from lattice import Lattice
+from recorder import Recorder
+from rule_stats import format_summary
+from species import EMPTY
+from termination import Termination
 
 
 class LatticeRunner(Thread):
@@ -9,28 +16,203 @@ class LatticeRunner(Thread):
     def __init__(self, args):
         Thread.__init__(self)
         self.args = args
-        self.lattice = Lattice(size=args.size,
-                               slider=args.slider,
-                               onlyRedBlue=not args.any,
-                               defKillers=args.defKillers,
-                               density=args.density,
-                               numRatio=args.numRatio,
-                               redAdvantage=args.redAdvantage,
-                               blueAdvantage=args.blueAdvantage,
-                               redGrowth=args.redGrowth,
-                               blueGrowth=args.blueGrowth,
-                               deathRate=100000)
+        if args.restore:
+            self.lattice = Lattice.load_checkpoint(args.restore)
+            print("Restored %s at generation %d" % (args.restore, self.lattice.generation))
+        else:
+            self.lattice = Lattice(size=(args.width, args.height),
+                                   slider=args.slider,
+                                   onlyRedBlue=not args.any,
+                                   defKillers=args.defKillers,
+                                   density=args.density,
+                                   numRatio=args.numRatio,
+                                   redAdvantage=args.redAdvantage,
+                                   blueAdvantage=args.blueAdvantage,
+                                   redGrowth=args.redGrowth,
+                                   blueGrowth=args.blueGrowth,
+                                   deathRate=100000,
+                                   activeSites=args.activeSites,
+                                   backend=args.backend,
+                                   seed=args.seed,
+                                   boundary=args.boundary)
+
+        if args.ruleStats:
+            self.lattice.instrument()
 
         self.args = args
         self.quit = False
+        self.termination = Termination(absorbing=not args.noEarlyStop,
+                                       window=args.steadyWindow,
+                                       tolerance=args.steadyTolerance)
+        # why the run stopped before args.evolutions, if it did
+        self.stop_reason = None
+        self.last_report = (time.perf_counter(), 0)
+        self.last_checkpoint = time.perf_counter()
+        self.checkpoint_writer = None
+        self.last_frame = time.perf_counter()
+        # how long the last publish took
+        self.publish_time = 0.0
+        self.frames = None
+        self.recorder = None
+        if args.record:
+            self.recorder = Recorder(args.record,
+                                     args.recordInterval or self.lattice.n_sites,
+                                     args.snapshotInterval)
 
     def stop(self):
         self.quit = True
 
+    @property
+    def params(self):
+        return self.lattice.params
+
+    def make_frames(self, lock=None, shared=False):
+        """
+        creates the FrameBuffer this runner publishes frames to (at
+        args.updateRate) and publishes the first frame. Other threads must
+        not touch the lattice after this, only the frames.
+
+        :param lock: see FrameBuffer
+        :param shared: see FrameBuffer
+        :return: FrameBuffer
+        """
+        lattice = self.lattice
+        self.frames = FrameBuffer(lattice.lattice.shape, lattice.lattice.dtype,
+                                  lattice.palette, lock=lock, shared=shared)
+        self.frames.publish(lattice)
+        return self.frames
+
     def run(self):
-        for iteration in range(0, self.args.evolutions):
-            self.lattice.evolve(1)
+        if self.args.profile:
+            profiler = cProfile.Profile()
+            profiler.runcall(self.simulate)
+            profiler.dump_stats(self.args.profile)
+            print("Profile written to %s" % self.args.profile)
+        else:
+            self.simulate()
+
+    def simulate(self):
+        self.record()
+        if self.args.sweep:
+            self.run_sweeps()
+        else:
+            self.run_steps()
+        self.finish_recording()
+        self.publish(force=True)
+        self.checkpoint(wait=True)
+        self.print_stop()
+
+    def print_stop(self):
+        if self.stop_reason is not None:
+            print("Stopped early at generation %d: %s" % (self.lattice.generation,
+                                                         self.stop_reason))
+        print("Generations: %d" % self.lattice.generation)
+
+    def run_steps(self):
+        lattice = self.lattice
+        while lattice.generation < self.args.evolutions and not self.should_stop():
+            if lattice.active is not None and not lattice.active:
+                # nothing can change any more, even with the early stops off
+                self.stop_reason = "no active sites"
+                break
+            lattice.evolve(min(lattice.backend.chunk,
+                               self.args.evolutions - lattice.generation))
             if self.quit:
                 print("Aborting")
                 break
-        print("Generations: %d" % self.lattice.generation)
+            self.report()
+            self.publish()
+            self.record()
+            self.checkpoint()
+
+    def run_sweeps(self):
+        while self.lattice.generation < self.args.evolutions and not self.should_stop():
+            self.lattice.evolve_sweep(1)
+            if self.quit:
+                print("Aborting")
+                break
+            self.report()
+            self.publish()
+            self.record()
+            self.checkpoint()
+
+    def should_stop(self):
+        """
+        checks for an absorbing or steady state, see termination.py, and
+        keeps the reason in stop_reason
+        """
+        self.stop_reason = self.termination.check(self.lattice)
+        return self.stop_reason is not None
+
+    def checkpoint(self, wait=False):
+        """
+        saves a checkpoint to args.checkpoint every args.checkpointInterval
+        seconds. Only copying the state holds up the simulation; the files
+        are written by a background thread.
+
+        :param wait: save now and wait until the files are written
+        """
+        if not self.args.checkpoint:
+            return
+        writer = self.checkpoint_writer
+        if not wait and (time.perf_counter() - self.last_checkpoint < self.args.checkpointInterval
+                         or writer is not None and writer.is_alive()):
+            return
+        if writer is not None:
+            writer.join()
+        self.last_checkpoint = time.perf_counter()
+        self.checkpoint_writer = Thread(target=write_checkpoint,
+                                        args=(self.args.checkpoint,
+                                              self.lattice.checkpoint_state(copy=True)))
+        self.checkpoint_writer.start()
+        if wait:
+            self.checkpoint_writer.join()
+
+    def publish(self, force=False):
+        """
+        publishes a frame if there is a FrameBuffer (see make_frames) and
+        the last one is older than both 1 / args.updateRate seconds and 4
+        times what publishing took: on large lattices it takes a while,
+        spend at most a fifth of the time on it
+        """
+        if self.frames is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last_frame < max(1.0 / self.args.updateRate,
+                                                      4 * self.publish_time):
+            return
+        self.last_frame = now
+        self.frames.publish(self.lattice)
+        self.publish_time = time.perf_counter() - now
+
+    def record(self):
+        """
+        passes the lattice to the recorder (args.record), which keeps a
+        record every args.recordInterval generations
+        """
+        if self.recorder is not None:
+            self.recorder.record(self.lattice)
+
+    def finish_recording(self):
+        if self.recorder is not None:
+            self.recorder.close(self.lattice)
+
+    def report(self):
+        """
+        prints the generation, counts and update rate every
+        args.statsInterval seconds when running headless
+        """
+        if not self.args.headless:
+            return
+        now, generation = time.perf_counter(), self.lattice.generation
+        last_time, last_generation = self.last_report
+        if now - last_time < self.args.statsInterval:
+            return
+        self.last_report = (now, generation)
+        lattice = self.lattice
+        print("{:,} | R:{:,} | B:{:,} | empty:{:,} | {:,.0f} updates/s".format(
+            generation, lattice.counts[0], lattice.counts[2],
+            int(lattice.population[EMPTY]),
+            (generation - last_generation) / (now - last_time)), flush=True)
+        if lattice.stats is not None:
+            print("\n".join(format_summary(lattice.stats.table())), flush=True)
@@ -0,0 +1,191 @@
+"""
+Level of detail rendering of (parts of) large lattices.
+
+A view shows a window of the lattice at a zoom of spp sites per pixel:
+spp = 1, 2, 4, ... when zoomed out (each pixel is the average color of an
+spp x spp block of sites, i.e. the species fractions of the block weighted
+by their colors) or spp = 1/2, 1/4, ... when zoomed in (each site is a
+block of pixels).
+
+Zoomed out views are rendered from block sums: for every level k from
+FIRST_LEVEL up, the summed colors of the 2^k x 2^k blocks of sites. They
+are kept up to date incrementally, region by region as the lattice
+changes (see update_sums and FrameBuffer.publish). Every view reads only
+what it shows, one level's sums or the visible sites, so the cost of a
+view depends on its size in pixels, not on the size of the lattice.
+"""
+import numpy as np
+
+# the finest level of block sums kept; finer zoom levels (2 x 2 blocks)
+# average the sites themselves, which would take more memory as sums
+FIRST_LEVEL = 2
+# zoom limit, in pixels per site
+MAX_MAGNIFICATION = 32
+
+
+def fit_spp(shape, width, height):
+    """
+    :return: smallest power of two of sites per pixel that shows the whole
+        lattice in width x height pixels
+    """
+    spp = 1
+    while spp * width < shape[0] or spp * height < shape[1]:
+        spp *= 2
+    return spp
+
+
+def zoom_in(spp):
+    if spp > 1:
+        return spp // 2
+    return max(spp / 2, 1.0 / MAX_MAGNIFICATION)
+
+
+def zoom_out(spp, limit):
+    """
+    :param limit: largest spp allowed, e.g. fit_spp
+    """
+    if spp < 1:
+        return spp * 2
+    return min(spp * 2, limit)
+
+
+def visible_sites(spp, width, height):
+    """
+    :return: number of rows and columns of sites a width x height pixel view
+        shows at spp sites per pixel
+    """
+    return int(np.ceil(width * spp)), int(np.ceil(height * spp))
+
+
+def clamp_origin(shape, origin, spp, width, height):
+    """
+    :return: origin (first visible row and column, fractional: pans of less
+        than a site add up) moved so the view stays on the lattice where
+        possible
+    """
+    return tuple(min(max(o, 0), max(n - pixels * spp, 0))
+                 for o, n, pixels in zip(origin, shape, (width, height)))
+
+
+def levels(shape):
+    """
+    :return: the levels of block sums kept for a lattice, up to the first
+        whose single block covers it
+    """
+    top = max(FIRST_LEVEL, int(np.ceil(np.log2(max(shape)))))
+    return list(range(FIRST_LEVEL, top + 1))
+
+
+def level_shape(shape, k):
+    """
+    :return: shape of the block sums of level k: blocks x blocks x (r, g, b)
+    """
+    return -(-shape[0] >> k), -(-shape[1] >> k), 3
+
+
+def level_dtype(k):
+    """
+    :return: the smallest unsigned dtype that holds the summed colors of a
+        2^k x 2^k block
+    """
+    return np.uint16 if (4 ** k) * 255 <= 0xffff else np.uint32
+
+
+def block_sums(a, size, dtype):
+    """
+    :param a: (rows, cols, 3) array
+    :return: sums of a over size x size blocks; blocks cut off by the end
+        of a sum what they have
+    """
+    ni, nj = -(-a.shape[0] // size), -(-a.shape[1] // size)
+    if a.shape[:2] != (ni * size, nj * size):
+        whole = np.zeros((ni * size, nj * size) + a.shape[2:], dtype=a.dtype)
+        whole[:a.shape[0], :a.shape[1]] = a
+        a = whole
+    # strided adds, much faster than summing over axes of a reshape
+    rows = a[0::size].astype(dtype)
+    for i in range(1, size):
+        rows += a[i::size]
+    total = rows[:, 0::size].copy()
+    for j in range(1, size):
+        total += rows[:, j::size]
+    return total
+
+
+def update_sums(sums, frame, palette, regions, align):
+    """
+    recomputes the block sums after the sites in regions changed
+
+    :param sums: {level: block sums}, see levels, level_shape and level_dtype
+    :param frame: 2d array of species ids
+    :param palette: (n_species, 3) colors, see Lattice.palette
+    :param regions: list of (rows, cols), each (start, stop), that changed
+    :param align: power of two the regions start at (and stop at, unless
+        at the end of the lattice). Levels of larger blocks than that are
+        recomputed whole from the level below.
+    """
+    for (r0, r1), (c0, c1) in regions:
+        below, size = np.take(palette, frame[r0:r1, c0:c1], axis=0), 1
+        for k in sorted(sums):
+            if 1 << k > align:
+                break
+            below, size = block_sums(below, (1 << k) // size, level_dtype(k)), 1 << k
+            sums[k][r0 >> k:(r0 >> k) + below.shape[0],
+                    c0 >> k:(c0 >> k) + below.shape[1]] = below
+    for k in sorted(sums):
+        if 1 << k > align:
+            sums[k][...] = block_sums(sums[k - 1], 2, level_dtype(k))
+
+
+def block_sites(n, first, count, size):
+    """
+    :return: number of sites of an axis of length n in each of count blocks
+        of size sites, from block first on
+    """
+    return np.clip(n - size * np.arange(first, first + count), 0, size)
+
+
+def decimate(frame, sums, palette, origin, spp, width, height):
+    """
+    renders the part of frame visible in a width x height pixel view
+
+    :param frame: 2d array of species ids (can be a memmap or a view)
+    :param sums: {level: block sums} of frame, see update_sums
+    :param palette: (n_species, 3) colors, see Lattice.palette
+    :param origin: (row, column) of the first visible site, fractional
+        parts shift a zoomed in view by part of a site
+    :param spp: sites per pixel, see module docstring
+    :return: uint8 RGB array of at most width x height pixels (less where
+        the view goes past the edge of the lattice). A block cut off by the
+        edge is the average of the sites it has, e.g. on lattices thinner
+        than spp.
+    """
+    i0, j0 = int(origin[0]), int(origin[1])
+    ni, nj = visible_sites(spp, width, height)
+    if spp < 1:
+        magnify = int(round(1 / spp))
+        # pixels of the first site that are left of (above) the view
+        di, dj = int((origin[0] - i0) * magnify), int((origin[1] - j0) * magnify)
+        sites = frame[i0:i0 + ni + 1, j0:j0 + nj + 1]
+        rgb = np.take(palette, sites, axis=0)
+        return rgb.repeat(magnify, axis=0).repeat(magnify, axis=1)[di:di + width, dj:dj + height]
+    if spp == 1:
+        return np.take(palette, frame[i0:i0 + ni, j0:j0 + nj], axis=0)
+
+    spp = int(spp)
+    k = spp.bit_length() - 1
+    bi, bj = i0 >> k, j0 >> k
+    if k in sums:
+        total = sums[k][bi:bi + width, bj:bj + height]
+    else:
+        sites = frame[bi << k:(bi + width) << k, bj << k:(bj + height) << k]
+        total = block_sums(np.take(palette, sites, axis=0), spp, np.uint32)
+    # only the last row and column of blocks can be cut off by the edge
+    mean = total >> (2 * k)
+    rows = block_sites(frame.shape[0], bi, total.shape[0], spp)
+    cols = block_sites(frame.shape[1], bj, total.shape[1], spp)
+    if len(rows) and rows[-1] < spp:
+        mean[-1] = total[-1] // (rows[-1] * cols)[:, None]
+    if len(cols) and cols[-1] < spp:
+        mean[:, -1] = total[:, -1] // (rows * cols[-1])[:, None]
+    return mean.astype(np.uint8)
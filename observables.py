@@ -0,0 +1,211 @@
+"""
+Coarsening observables of a lattice: interface length, domains and pair
+correlation functions.
+
+The functions take a 2d array of species ids, e.g. Lattice.lattice, a
+snapshot from recorder.read_snapshots or a checkpoint's memory-mapped
+.npy. Neighbors are the 4 nearest sites. With periodic=True the lattice
+wraps around (pass it for lattices with the periodic boundary, the
+default of Lattice), otherwise it does not.
+"""
+import numpy as np
+
+from boundary import PERIODIC
+from lattice import LatticeObserver
+from species import EMPTY
+
+# rows per block when scanning large (e.g. memory-mapped) lattices
+BLOCK_ROWS = 1024
+
+
+def unlike_pairs(a, b):
+    """
+    :return: number of positions where a and b hold two different species,
+        neither of them empty
+    """
+    return int(np.count_nonzero((a != b) & (a != EMPTY) & (b != EMPTY)))
+
+
+def wraps(shape, periodic):
+    """
+    :return: (rows, columns): whether the axes wrap around. An axis of at
+        most 2 sites never does, its only pairs are those within it.
+    """
+    return periodic and shape[0] > 2, periodic and shape[1] > 2
+
+
+def interface_length(lattice, periodic=False):
+    """
+    number of nearest neighbor pairs of two different species, neither of
+    them empty. Reads the lattice in blocks of rows, so memory-mapped
+    lattices are never loaded whole.
+    :param lattice: 2d array of species ids
+    :param periodic: if True, pairs wrap around the edges
+    :return: int
+    """
+    wrap_rows, wrap_cols = wraps(lattice.shape, periodic)
+    n = 0
+    for start in range(0, lattice.shape[0], BLOCK_ROWS):
+        # one row of overlap with the next block for the vertical pairs
+        block = np.asarray(lattice[start:start + BLOCK_ROWS + 1])
+        n += unlike_pairs(block[1:], block[:-1])
+        horizontal = block[:BLOCK_ROWS]
+        n += unlike_pairs(horizontal[:, 1:], horizontal[:, :-1])
+        if wrap_cols:
+            n += unlike_pairs(horizontal[:, -1], horizontal[:, 0])
+    if wrap_rows:
+        n += unlike_pairs(np.asarray(lattice[-1]), np.asarray(lattice[0]))
+    return n
+
+
+class InterfaceLength(LatticeObserver):
+    """
+    Keeps the interface length of a lattice up to date as sites change
+    (O(1) per change), e.g. to query it often:
+
+        observer = InterfaceLength(lattice)
+        lattice.evolve(n)
+        observer.length
+
+    Pairs wrap around the edges if the lattice's boundary is periodic.
+    """
+
+    def __init__(self, lattice):
+        self.periodic = lattice.boundary == PERIODIC
+        self.wrap = wraps(lattice.lattice.shape, self.periodic)
+        self.length = interface_length(lattice.lattice, self.periodic)
+        lattice.add_observer(self)
+
+    def cell_changed(self, lattice, i, j, old, new):
+        a = lattice.lattice
+        wrap_rows, wrap_cols = self.wrap
+        for ni, nj in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1)):
+            if wrap_rows:
+                ni %= lattice.x
+            if wrap_cols:
+                nj %= lattice.y
+            if 0 <= ni < lattice.x and 0 <= nj < lattice.y:
+                neighbor = a[ni, nj]
+                if neighbor != EMPTY:
+                    self.length += int(new != EMPTY and new != neighbor) - \
+                        int(old != EMPTY and old != neighbor)
+
+    def lattice_changed(self, lattice):
+        self.length = interface_length(lattice.lattice, self.periodic)
+
+
+def label_domains(lattice, periodic=False):
+    """
+    labels the domains (connected clusters of sites of one species) by
+    vectorized union-find: every round hooks each root onto the smallest
+    root across its bonds and then jumps pointers until all are flat.
+
+    :param lattice: 2d array of species ids
+    :param periodic: if True, domains wrap around the edges
+    :return: int64 array shaped like lattice: for every occupied site the
+        flat index of a site of its domain (the same for the whole
+        domain), -1 for empty sites
+    """
+    lattice = np.asarray(lattice)
+    flat = lattice.ravel()
+    index = np.arange(flat.size).reshape(lattice.shape)
+    # bonds between equal, occupied nearest neighbors
+    pairs = [(lattice[1:], lattice[:-1], index[1:], index[:-1]),
+             (lattice[:, 1:], lattice[:, :-1], index[:, 1:], index[:, :-1])]
+    wrap_rows, wrap_cols = wraps(lattice.shape, periodic)
+    if wrap_rows:
+        pairs.append((lattice[-1], lattice[0], index[-1], index[0]))
+    if wrap_cols:
+        pairs.append((lattice[:, -1], lattice[:, 0], index[:, -1], index[:, 0]))
+    a, b = [], []
+    for x, y, ix, iy in pairs:
+        bond = (x == y) & (x != EMPTY)
+        a.append(ix[bond])
+        b.append(iy[bond])
+    a, b = np.concatenate(a), np.concatenate(b)
+
+    parent = np.arange(flat.size)
+    while True:
+        ra, rb = parent[a], parent[b]
+        linked = ra != rb
+        if not linked.any():
+            break
+        a, b, ra, rb = a[linked], b[linked], ra[linked], rb[linked]
+        np.minimum.at(parent, np.maximum(ra, rb), np.minimum(ra, rb))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    parent[flat == EMPTY] = -1
+    return parent.reshape(lattice.shape)
+
+
+def domain_sizes(lattice, periodic=False):
+    """
+    :param lattice: 2d array of species ids
+    :param periodic: see label_domains
+    :return: (species, sizes): species id and number of sites of every
+        domain, see label_domains
+    """
+    labels = label_domains(lattice, periodic).ravel()
+    roots, sizes = np.unique(labels[labels >= 0], return_counts=True)
+    return np.asarray(lattice).ravel()[roots], sizes
+
+
+def pair_correlation(lattice, species, periodic=False, max_distance=None):
+    """
+    radially averaged pair correlation functions, computed with FFTs
+
+        g(r) = <n(x) n(x + d)> / <n>^2   averaged over |d| rounded to r
+
+    where n is 1 on the sites of a species and 0 elsewhere. g(r) tends to 1
+    at distances beyond the domain size.
+
+    :param lattice: 2d array of species ids
+    :param species: species id or sequence of them
+    :param periodic: if True, pairs wrap around the edges. If False, only
+        pairs within the lattice count (the fields are zero padded).
+    :param max_distance: largest r, default half the smaller dimension (of
+        the length of one dimensional lattices)
+    :return: (r, g): distances 0..max_distance and g, shaped
+        (len(species), len(r)) (or (len(r),) for a single species)
+    """
+    lattice = np.asarray(lattice)
+    single = np.isscalar(species)
+    species = np.atleast_1d(species)
+    nx, ny = lattice.shape
+    if max_distance is None:
+        max_distance = (max(nx, ny) if min(nx, ny) == 1 else min(nx, ny)) // 2
+    shape = (nx, ny) if periodic else (2 * nx, 2 * ny)
+
+    def autocorrelation(field):
+        f = np.fft.rfft2(field, s=shape)
+        return np.fft.irfft2(f * np.conj(f), s=shape)
+
+    # displacements of every entry of the autocorrelation, and the number
+    # of pairs of sites (within the lattice) at each
+    dx = np.fft.fftfreq(shape[0], 1.0 / shape[0])[:, None]
+    dy = np.fft.fftfreq(shape[1], 1.0 / shape[1])[None, :]
+    r = np.rint(np.hypot(dx, dy)).astype(np.int64)
+    if periodic:
+        within = r <= max_distance
+        pairs = float(nx * ny)
+    else:
+        pairs = autocorrelation(np.ones((nx, ny)))
+        within = (r <= max_distance) & (pairs > 0.5)
+        pairs = pairs[within]
+    bins = r[within]
+    n_bins = np.bincount(bins, minlength=max_distance + 1)
+
+    g = np.zeros((len(species), max_distance + 1))
+    for k, s in enumerate(species):
+        field = (lattice == s).astype(float)
+        density = field.mean()
+        if density == 0:
+            continue
+        c = autocorrelation(field)[within] / pairs / density ** 2
+        g[k] = np.bincount(bins, weights=c, minlength=max_distance + 1) / \
+            np.maximum(n_bins, 1)
+    distances = np.arange(max_distance + 1)
+    return distances, g[0] if single else g
@@ -0,0 +1,183 @@
+import signal
+from multiprocessing import Array, Barrier, Process, Value, shared_memory
+from multiprocessing.connection import wait
+from threading import BrokenBarrierError, Thread
+
+import numpy as np
+
+from boundary import fill_ghosts
+from lattice_runner import LatticeRunner
+from sweep import geometry, sweep_phase
+
+
+def sweep_worker(shm_name, shape, dtype, kill_table, rules, boundary, sources, rows, cols,
+                 seed, order_seed, start, phase, command, population):
+    """
+    Worker process: runs sweeps over its own band of the shared lattice
+    until it is told to stop.
+
+    All workers visit the sub-lattices in the same order (same order_seed)
+    and meet at the phase barrier after each one, so a site is never
+    updated while a site in its neighborhood is being updated by another
+    worker. Sites next to the band (the halo) are read straight from the
+    shared buffer. Each worker updates the ghost cells (see boundary.py)
+    that copy cells of its band.
+
+    :param shape: shape of the padded lattice
+    :param sources: (Lattice.row_sources, Lattice.col_sources)
+    :param start: Barrier shared with the controller, passed at the start
+        and at the end of every batch of sweeps
+    :param phase: Barrier between the workers, passed after every sub-lattice
+    :param command: Value, number of sweeps in the next batch (0 to stop)
+    :param population: this worker's row of a shared array, set to the
+        population of its band after every batch
+    """
+    # Ctrl-C goes to the whole process group: only the controller handles
+    # it (by stopping the workers after the batch)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        padded = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        rng = np.random.default_rng(seed)
+        order = np.random.default_rng(order_seed)
+        offsets, phases = geometry((shape[0] - 2, shape[1] - 2), boundary)
+        band = padded[rows[0] + 1:rows[1] + 1, cols[0] + 1:cols[1] + 1]
+        population = np.frombuffer(population, dtype=np.int64)
+        while True:
+            start.wait()
+            n_sweeps = command.value
+            if n_sweeps <= 0:
+                break
+            for t in range(n_sweeps):
+                for k in order.permutation(len(phases)):
+                    sweep_phase(padded, kill_table, rules, rng, phases[k], rows, cols,
+                                offsets)
+                    fill_ghosts(padded, sources[0], sources[1], rows, cols)
+                    phase.wait()
+            population[:] = np.bincount(band.ravel(), minlength=len(population))
+            start.wait()
+        del padded, band
+    except BrokenBarrierError:
+        # another worker died, see watch_workers
+        pass
+    except BaseException:
+        start.abort()
+        phase.abort()
+        raise
+    finally:
+        shm.close()
+
+
+def watch_workers(processes, barriers):
+    """
+    aborts the barriers as soon as a worker process dies (crashes or is
+    killed), so that nobody waits for it forever
+    """
+    pending = {p.sentinel: p for p in processes}
+    while pending:
+        for sentinel in wait(list(pending)):
+            process = pending.pop(sentinel)
+            # the sentinel can be ready a moment before the exit code is
+            process.join()
+            if process.exitcode:
+                for barrier in barriers:
+                    barrier.abort()
+                return
+
+
+class ParallelLatticeRunner(LatticeRunner):
+    """
+    Runs vectorized sweeps (see sweep.py) in several worker processes.
+
+    The lattice is moved into shared memory and split into bands of rows
+    (of columns if it has more columns than rows, e.g. one dimensional
+    lattices), one per worker. This thread only hands out batches of
+    sweeps; the workers count the population of their bands, so between
+    batches it only adds those up.
+    """
+
+    def __init__(self, args):
+        LatticeRunner.__init__(self, args)
+        self.workers = args.workers
+
+    def bands(self):
+        """
+        splits the sites updated by a sweep into one band per worker, along
+        the longer axis
+        :return: list of (rows, cols), each (start, stop)
+        """
+        rows, cols = (0, self.lattice.x), (0, self.lattice.y)
+        if self.lattice.y > self.lattice.x:
+            return [(rows, band) for band in self.split(cols)]
+        return [(band, cols) for band in self.split(rows)]
+
+    def split(self, axis):
+        edges = np.linspace(axis[0], axis[1], self.workers + 1).astype(int)
+        return list(zip(edges[:-1], edges[1:]))
+
+    def simulate(self):
+        lattice = self.lattice
+        self.record()
+
+        shm = shared_memory.SharedMemory(create=True, size=lattice.padded.nbytes)
+        shared = np.ndarray(lattice.padded.shape, dtype=lattice.padded.dtype,
+                            buffer=shm.buf)
+        shared[...] = lattice.padded
+        lattice.attach(shared)
+
+        start = Barrier(self.workers + 1)
+        phase = Barrier(self.workers)
+        command = Value('q', 1, lock=False)
+        n_species = len(lattice.population)
+        populations = [Array('q', n_species, lock=False) for w in range(self.workers)]
+        seeds = lattice.spawn(self.workers + 1)
+        order_seed = seeds.pop()
+        processes = [Process(target=sweep_worker,
+                             args=(shm.name, shared.shape, shared.dtype,
+                                   lattice.kill_table, lattice.rules, lattice.boundary,
+                                   (lattice.row_sources, lattice.col_sources), rows, cols,
+                                   seed, order_seed, start, phase, command, population),
+                             daemon=True)
+                     for (rows, cols), seed, population
+                     in zip(self.bands(), seeds, populations)]
+        for p in processes:
+            p.start()
+        Thread(target=watch_workers, args=(processes, (start, phase)), daemon=True).start()
+
+        try:
+            while lattice.generation < self.args.evolutions and not self.quit \
+                    and not self.should_stop():
+                start.wait()
+                # the workers sweep until they all reach the barrier again
+                start.wait()
+                # the workers are waiting, so the lattice is consistent
+                lattice.generation += lattice.n_sites
+                lattice.population = sum(np.frombuffer(p, dtype=np.int64)
+                                         for p in populations)
+                lattice.refresh(population=False)
+                self.report()
+                self.publish()
+                self.record()
+                self.checkpoint()
+            if self.quit:
+                print("Aborting")
+            command.value = 0
+            start.wait()
+        except BrokenBarrierError:
+            print("A sweep worker died, aborting")
+        finally:
+            for p in processes:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.terminate()
+            lattice.attach(shared.copy())
+            # a dead worker may have left its ghost cells behind
+            lattice.fill_ghosts()
+            lattice.refresh()
+            del shared
+            shm.close()
+            shm.unlink()
+        self.finish_recording()
+        self.publish(force=True)
+        self.checkpoint(wait=True)
+        self.print_stop()
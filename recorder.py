@@ -0,0 +1,172 @@
+"""
+Time series and snapshots of a running Lattice.
+
+A recording is a directory of append-only chunk files:
+
+    series-000000.npz      one row per record: generation, time, red, blue,
+                           empty, interface and rate (updates/s) columns
+    snapshots-000000.npz   compressed lattice arrays ("lattice", stacked)
+                           with the generation of each ("generation")
+
+Rows and snapshots are buffered and every full chunk is written by a
+background thread, so the simulation thread only pays for the counts, the
+interface length and (for snapshots) a copy of the lattice. Recording into
+an existing directory appends new chunks after the ones already there,
+e.g. when continuing from a checkpoint.
+"""
+import glob
+import os
+import time
+from queue import Queue
+from threading import Thread
+
+import numpy as np
+
+from boundary import PERIODIC
+from observables import interface_length
+from species import EMPTY
+
+COLUMNS = ("generation", "time", "red", "blue", "empty", "interface", "rate")
+
+# rows per series chunk
+SERIES_CHUNK = 4096
+# bytes of lattice arrays per snapshot chunk
+SNAPSHOT_CHUNK_BYTES = 64 << 20
+
+
+def chunk_files(path, kind):
+    return sorted(glob.glob(os.path.join(path, kind + "-*.npz")))
+
+
+def read_series(path):
+    """
+    :param path: recording directory
+    :return: dict of column name to array, all chunks concatenated
+    """
+    chunks = []
+    for name in chunk_files(path, "series"):
+        with np.load(name) as f:
+            chunks.append({column: f[column] for column in COLUMNS})
+    return {column: np.concatenate([c[column] for c in chunks]) if chunks else np.empty(0)
+            for column in COLUMNS}
+
+
+def read_snapshots(path):
+    """
+    yields the snapshots of a recording one chunk file at a time
+    :param path: recording directory
+    :return: iterator of (generation, lattice)
+    """
+    for name in chunk_files(path, "snapshots"):
+        with np.load(name) as f:
+            generations, lattices = f["generation"], f["lattice"]
+        for generation, lattice in zip(generations, lattices):
+            yield int(generation), lattice
+
+
+class Recorder(object):
+
+    def __init__(self, path, interval, snapshotInterval=0):
+        """
+        :param path: str
+            Directory to write the recording to, created if needed.
+
+        :param interval: int
+            Generations between records.
+
+        :param snapshotInterval: int, optional
+            Generations between lattice snapshots, 0 for none.
+        """
+        self.path = path
+        self.interval = interval
+        self.snapshotInterval = snapshotInterval
+        os.makedirs(path, exist_ok=True)
+        self.n_chunks = {kind: len(chunk_files(path, kind)) for kind in ("series", "snapshots")}
+
+        self.rows = []
+        self.snapshots = []
+        self.next_record = None
+        self.next_snapshot = None
+        self.last = None
+
+        self.queue = Queue()
+        self.writer = Thread(target=self.write_chunks, daemon=True)
+        self.writer.start()
+
+    def record(self, lattice):
+        """
+        records lattice if it reached the next record (or snapshot)
+        generation. Cheap to call after every chunk of updates.
+        """
+        generation = lattice.generation
+        if self.next_record is None:
+            self.next_record = generation
+            self.next_snapshot = generation
+        if generation >= self.next_record:
+            self.next_record = generation + self.interval
+            self.add_row(lattice)
+        if self.snapshotInterval and generation >= self.next_snapshot:
+            self.next_snapshot = generation + self.snapshotInterval
+            self.snapshots.append((generation, np.array(lattice.lattice)))
+            if sum(s.nbytes for g, s in self.snapshots) >= SNAPSHOT_CHUNK_BYTES:
+                self.flush_snapshots()
+
+    def add_row(self, lattice):
+        now, generation = time.perf_counter(), lattice.generation
+        if self.last is None or now <= self.last[0]:
+            rate = 0.0
+        else:
+            rate = (generation - self.last[1]) / (now - self.last[0])
+        self.last = (now, generation)
+        red, green, blue = lattice.counts
+        self.rows.append((generation, time.time(), red, blue,
+                          int(lattice.population[EMPTY]),
+                          interface_length(lattice.lattice, lattice.boundary == PERIODIC),
+                          rate))
+        if len(self.rows) >= SERIES_CHUNK:
+            self.flush_series()
+
+    def flush_series(self):
+        if not self.rows:
+            return
+        columns = list(zip(*self.rows))
+        self.rows = []
+        arrays = {name: np.array(values, dtype=float if name in ("time", "rate") else np.int64)
+                  for name, values in zip(COLUMNS, columns)}
+        self.queue.put((self.chunk_name("series"), arrays, False))
+
+    def flush_snapshots(self):
+        if not self.snapshots:
+            return
+        generations, lattices = zip(*self.snapshots)
+        self.snapshots = []
+        arrays = {"generation": np.array(generations, dtype=np.int64),
+                  "lattice": np.stack(lattices)}
+        self.queue.put((self.chunk_name("snapshots"), arrays, True))
+
+    def chunk_name(self, kind):
+        name = os.path.join(self.path, "%s-%06d.npz" % (kind, self.n_chunks[kind]))
+        self.n_chunks[kind] += 1
+        return name
+
+    def write_chunks(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            name, arrays, compressed = item
+            with open(name + ".tmp", "wb") as f:
+                (np.savez_compressed if compressed else np.savez)(f, **arrays)
+            os.replace(name + ".tmp", name)
+
+    def close(self, lattice=None):
+        """
+        writes what is still buffered and waits for the writer
+        :param lattice: if given, record its final state first
+        """
+        if lattice is not None and (self.last is None or self.last[1] != lattice.generation):
+            self.add_row(lattice)
+        self.flush_series()
+        self.flush_snapshots()
+        self.queue.put(None)
+        self.writer.join()
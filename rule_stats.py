@@ -0,0 +1,89 @@
+"""
+Per-rule counters and sampled timers for the single site update loop.
+
+Lattice.step returns a code for what it did: the rule that applied times
+two, plus one if the rule changed the site (e.g. a kill that happened)
+or zero if it was rejected. Lattice.evolve_python ignores the code unless
+the lattice has a RuleStats (see Lattice.instrument), so the plain loop
+pays nothing for the counters.
+"""
+import time
+
+import numpy as np
+
+RULES = ("random_death", "kill_red", "kill_blue", "kill_enemies", "fill", "idle")
+RANDOM_DEATH, KILL_RED, KILL_BLUE, KILL_ENEMIES, FILL, IDLE = range(len(RULES))
+N_CODES = 2 * len(RULES)
+
+# rows of RuleStats.table()
+COUNTS, TIMED, TIME_NS = range(3)
+
+
+class RuleStats(object):
+    """
+    counts of every step code, and the time taken by every sample_every-th
+    step (per code)
+    """
+
+    def __init__(self, sample_every=64):
+        """
+        :param sample_every: int, optional
+            Time one step out of this many.
+        """
+        self.sample_every = sample_every
+        self.counts = [0] * N_CODES
+        self.timed = [0] * N_CODES
+        self.time_ns = [0] * N_CODES
+
+    def evolve(self, step, n_steps):
+        """
+        runs step() n_steps times, counting the codes it returns
+        :param step: Lattice.step
+        """
+        counts = self.counts
+        every = self.sample_every
+        clock = time.perf_counter_ns
+        for t in range(n_steps):
+            if t % every:
+                code = step()
+                if code is None:
+                    return
+            else:
+                start = clock()
+                code = step()
+                elapsed = clock() - start
+                if code is None:
+                    return
+                self.timed[code] += 1
+                self.time_ns[code] += elapsed
+            counts[code] += 1
+
+    def table(self):
+        """
+        :return: int64 array (3, N_CODES) of the counts, numbers of timed
+            steps and their total time in ns
+        """
+        return np.array([self.counts, self.timed, self.time_ns], dtype=np.int64)
+
+
+def summary(table):
+    """
+    :param table: as returned by RuleStats.table
+    :return: list of (rule, events, accepted fraction, mean ns per event,
+        estimated fraction of the total time) of the rules that happened
+    """
+    table = np.asarray(table, dtype=float).reshape(3, len(RULES), 2)
+    events = table[COUNTS].sum(axis=1)
+    mean_ns = table[TIME_NS].sum(axis=1) / np.maximum(table[TIMED].sum(axis=1), 1)
+    total = max((events * mean_ns).sum(), 1)
+    return [(rule, int(events[r]), table[COUNTS, r, 1] / events[r], mean_ns[r],
+             events[r] * mean_ns[r] / total)
+            for r, rule in enumerate(RULES) if events[r] > 0]
+
+
+def format_summary(table):
+    """
+    :return: one line of text per rule, see summary
+    """
+    return ["{:<12} {:>13,} | acc {:6.1%} | {:7,.0f}ns | {:5.1%} of time".format(*row)
+            for row in summary(table)]
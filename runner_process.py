@@ -0,0 +1,71 @@
+"""
+Runs the simulation in a separate process, so the display and the
+simulation do not share an interpreter (and its GIL). The frames are
+shared through a FrameBuffer in shared memory, see frames.py.
+"""
+import signal
+from multiprocessing import Lock, Pipe, Process
+from threading import Thread
+
+from frames import FrameBuffer
+
+
+def simulate(args, lock, connection):
+    """
+    Process target: builds the runner, sends the frame buffer's name (and
+    what a display needs to know about the lattice) to the parent, waits
+    until the parent has attached and runs the simulation until it is done
+    or the parent sends "stop".
+    """
+    # the parent handles Ctrl-C and sends "stop"
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # imported here so the parent never builds a lattice
+    from lattice_runner import LatticeRunner
+    from parallel_runner import ParallelLatticeRunner
+
+    runner = ParallelLatticeRunner(args) if args.workers > 1 else LatticeRunner(args)
+    frames = runner.make_frames(lock=lock, shared=True)
+    try:
+        connection.send((frames.name, frames.shape, frames.dtype.str, frames.palette,
+                         runner.params))
+        connection.recv()
+
+        def watch():
+            # nothing the parent waits on: the child may exit any time
+            try:
+                connection.recv()
+            except EOFError:
+                return
+            runner.stop()
+        Thread(target=watch, daemon=True).start()
+        runner.run()
+    finally:
+        frames.close(unlink=True)
+
+
+class RunnerProcess(object):
+    """
+    Stands in for a LatticeRunner thread (start, stop, join, is_alive,
+    frames, params) while the runner itself lives in a child process.
+    """
+
+    def __init__(self, args):
+        lock = Lock()
+        self.connection, child = Pipe()
+        self.process = Process(target=simulate, args=(args, lock, child))
+        self.process.start()
+        name, shape, dtype, palette, self.params = self.connection.recv()
+        self.frames = FrameBuffer(shape, dtype, palette, lock=lock, name=name)
+
+    def start(self):
+        self.connection.send(True)
+
+    def stop(self):
+        if self.process.is_alive():
+            self.connection.send("stop")
+
+    def join(self):
+        self.process.join()
+
+    def is_alive(self):
+        return self.process.is_alive()
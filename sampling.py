@@ -0,0 +1,49 @@
+"""
+Low overhead random sampling for the single site update loop.
+"""
+import numpy as np
+
+# uniforms drawn per refill of a RandomStream
+BLOCK_SIZE = 1 << 14
+
+
+class RandomStream(object):
+    """
+    Uniform random numbers in [0, 1) drawn from a numpy Generator in large
+    blocks and handed out one at a time, in order. Much cheaper per number
+    than calling numpy for each one.
+    """
+
+    def __init__(self, generator=None, block_size=BLOCK_SIZE):
+        """
+        :param generator: np.random.Generator, optional
+            Source of the blocks. Defaults to a new unseeded Generator.
+
+        :param block_size: int, optional
+            Number of uniforms drawn at a time.
+        """
+        self.generator = np.random.default_rng() if generator is None else generator
+        self.block_size = block_size
+        self.block = []
+        self.position = 0
+
+    def uniform(self):
+        if self.position == len(self.block):
+            self.block = self.generator.random(self.block_size).tolist()
+            self.position = 0
+        u = self.block[self.position]
+        self.position += 1
+        return u
+
+
+def split_uniform(u, n):
+    """
+    splits one uniform into a uniform index in [0, n) and a fresh uniform
+    in [0, 1) independent of it (the fractional part of u * n)
+    :param u: float in [0, 1)
+    :param n: int
+    :return: (index, uniform)
+    """
+    scaled = u * n
+    k = int(scaled)
+    return k, scaled - k
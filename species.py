@@ -0,0 +1,12 @@
+# species ids. The lattice stores one small unsigned integer per site; colors
+# and killing effectiveness live in per-species tables indexed by these ids.
+EMPTY = 0
+RED = 1
+BLUE = 2
+
+RED_COLOR = 0xe41a1c
+BLUE_COLOR = 0x377eb8
+# BLUE_COLOR = 0x4daf4a
+
+# largest number of distinct species in "any color" mode (fits in uint16)
+MAX_SPECIES = 0xffff
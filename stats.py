@@ -1,4 +1,25 @@
 #!/usr/bin/env python3
+"""
+Prints the top entries of a profile, e.g. written with --profile:
+
+    python stats.py profile.prof -n 20
+"""
+import argparse
 import pstats
-p = pstats.Stats('profile.prof')
-p.sort_stats('cumulative').print_stats(10)
\ No newline at end of file
+
+parser = argparse.ArgumentParser()
+parser.add_argument("path",
+                    nargs="?",
+                    help="cProfile/pstats file",
+                    default="profile.prof")
+parser.add_argument("-n",
+                    type=int,
+                    help="Number of entries to print",
+                    default=10)
+parser.add_argument("--sort",
+                    help="pstats sort key, e.g. cumulative, tottime, ncalls",
+                    default="cumulative")
+args = parser.parse_args()
+
+p = pstats.Stats(args.path)
+p.sort_stats(args.sort).print_stats(args.n)
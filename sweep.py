@@ -0,0 +1,165 @@
+"""
+Batched (vectorized) Monte Carlo updates.
+
+The lattice is split into four sub-lattices by the parity of the row and
+column index. Two sites of the same sub-lattice are at least two cells apart,
+so no site's 3x3 neighborhood contains another site of its sub-lattice and a
+whole sub-lattice can be updated at once with the same rules as
+Lattice.evolve. One sweep visits the four sub-lattices in random order, i.e.
+every site gets one update attempt per sweep. On a periodic axis of odd
+length the first and the last index are neighbors, so the last index gets
+a sub-lattice of its own.
+
+A one dimensional lattice (a single row or column) has only its two
+neighbors along the line and two sub-lattices, by the parity of the index
+along it.
+
+The sweeps work on the padded lattice (see boundary.py): neighbors are read
+from shifted views of it, including the ghost cells, which the caller
+updates after every sub-lattice.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from boundary import PERIODIC
+from species import EMPTY, RED, BLUE
+
+# the parameters of the update rules
+Rules = namedtuple('Rules', ['onlyRedBlue', 'slider', 'redAdvantage',
+                             'blueAdvantage', 'defKillers', 'thresh'])
+
+# offsets of the 3x3 neighborhood, including the site itself
+OFFSETS = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1)]
+
+# the same for a one dimensional lattice: a single row
+LINE_OFFSETS = [(0, -1), (0, 0), (0, 1)]
+
+# and a single column
+COLUMN_OFFSETS = [(-1, 0), (0, 0), (1, 0)]
+
+
+def axis_classes(n, periodic):
+    """
+    splits the indices of an axis into classes of indices at least two
+    apart (also across the wrap, if periodic)
+    :param n: length of the axis
+    :return: list of (first, stop): every second index from first, below stop
+    """
+    if n == 1:
+        return [(0, 1)]
+    if periodic and n % 2:
+        return [(0, n - 1), (1, n), (n - 1, n)]
+    return [(0, n), (1, n)]
+
+
+def geometry(shape, boundary=PERIODIC):
+    """
+    :param shape: shape of the lattice
+    :param boundary: see boundary.py
+    :return: (offsets, phases) to sweep it with: the neighborhood and the
+        sub-lattices, as (row class, column class) (see axis_classes)
+    """
+    offsets = LINE_OFFSETS if shape[0] == 1 else COLUMN_OFFSETS if shape[1] == 1 else OFFSETS
+    periodic = boundary == PERIODIC
+    phases = [(rows, cols) for rows in axis_classes(shape[0], periodic)
+              for cols in axis_classes(shape[1], periodic)]
+    return offsets, phases
+
+
+def sublattice(start, stop, index_class):
+    """
+    indices in [start, stop) of a class
+    :param start:
+    :param stop:
+    :param index_class: (first, stop), see axis_classes
+    :return: (first index, number of indices)
+    """
+    first, last = index_class
+    if start > first:
+        first += (start - first + 1) // 2 * 2
+    return first, max(0, (min(stop, last) - first + 1) // 2)
+
+
+def shifted(first, n, offset):
+    """
+    slice selecting n indices 2 apart, starting at first + offset
+    """
+    return slice(first + offset, first + offset + 2 * n - 1, 2)
+
+
+def neighborhood(padded, offsets, i0, ni, j0, nj):
+    """
+    the cells at each offset from the ni x nj sites i0, i0 + 2, ... x
+    j0, j0 + 2, ... of a lattice
+
+    :param padded: padded lattice
+    :return: list of arrays shaped (ni, nj), one per offset
+    """
+    return [padded[shifted(i0 + 1, ni, di), shifted(j0 + 1, nj, dj)] for di, dj in offsets]
+
+
+def enemy_weight(centre, neighborhood, kill_table, axis=None):
+    """
+    summed killing effectiveness of the cells of a neighborhood that are
+    neither empty nor of the centre's species (any color mode). Works on a
+    single site or on a whole batch of sites at once.
+
+    :param centre: species id, or array of them
+    :param neighborhood: array of species ids; the neighbors of a site are
+        along axis, the other axes broadcast against centre
+    :param kill_table: killing effectiveness per species, 0 for EMPTY
+    :param axis: axis of neighborhood to sum over, None for all
+    :return: float, or array shaped like centre
+    """
+    # empty cells need no mask: kill_table[EMPTY] is 0
+    return np.where(neighborhood != centre, kill_table[neighborhood], 0).sum(axis=axis)
+
+
+def sweep_phase(padded, kill_table, rules, rng, phase, rows, cols, offsets=OFFSETS):
+    """
+    updates every site of one sub-lattice within rows x cols in place
+
+    :param padded: padded lattice, see boundary.py
+    :param kill_table: killing effectiveness per species (any color mode)
+    :param rules: Rules
+    :param rng: source of uniforms, e.g. np.random or a np.random.Generator
+    :param phase: (row class, column class) of the sub-lattice, see geometry
+    :param rows: (start, stop) of the rows to update
+    :param cols: (start, stop) of the columns to update
+    :param offsets: the neighborhood, see geometry
+    :return: number of sites updated
+    """
+    i0, ni = sublattice(rows[0], rows[1], phase[0])
+    j0, nj = sublattice(cols[0], cols[1], phase[1])
+    if ni == 0 or nj == 0:
+        return 0
+
+    cells = neighborhood(padded, offsets, i0, ni, j0, nj)
+    centre = cells[offsets.index((0, 0))]
+    new = centre.copy()
+    shape = centre.shape
+
+    # random death: replace the site with a random cell of its neighborhood
+    death = rules.slider > rng.random(shape)
+    if death.any():
+        pick = (rng.random(shape) * len(offsets)).astype(np.intp)
+        replacement = np.choose(pick, cells)
+        new[death] = replacement[death]
+
+    # killing
+    u = rng.random(shape)
+    if rules.onlyRedBlue:
+        if not rules.defKillers:
+            n_red = sum((n == RED).astype(np.int8) for n in cells)
+            n_blue = sum((n == BLUE).astype(np.int8) for n in cells)
+            kill = ((centre == RED) & (n_blue * u * rules.blueAdvantage > rules.thresh)) | \
+                   ((centre == BLUE) & (n_red * u * rules.redAdvantage > rules.thresh))
+            new[kill & ~death] = EMPTY
+    else:
+        weight = enemy_weight(centre, np.stack(cells), kill_table, axis=0)
+        kill = (centre != EMPTY) & (weight * u > 2)
+        new[kill & ~death] = EMPTY
+
+    padded[shifted(i0 + 1, ni, 0), shifted(j0 + 1, nj, 0)] = new
+    return centre.size
@@ -0,0 +1,95 @@
+"""
+Early termination of runs.
+
+A run can stop before its generation budget once
+
+- a species died out (red/blue mode), or at most one species is left
+  (any color mode): the competition is over;
+- optionally, the counts reached a statistical steady state: sampled once
+  per lattice's worth of updates, the mean counts of the first and second
+  half of the last `window` samples differ by at most `tolerance` times
+  the number of sites.
+
+Runs with activeSites also stop once the active set is empty, i.e.
+nothing can change any more, but the run loops check that themselves:
+turning the early stops off must not make them spin forever.
+"""
+import numpy as np
+
+from species import EMPTY, RED, BLUE
+
+
+class Termination(object):
+
+    def __init__(self, absorbing=True, window=0, tolerance=0.001):
+        """
+        :param absorbing: bool, optional
+            Stop in absorbing states (extinction, fixation).
+
+        :param window: int, optional
+            Number of count samples the steady state test looks at, at
+            least 2, or 0 to disable it.
+
+        :param tolerance: float, optional
+            Largest difference of the half window means, as a fraction of
+            the number of sites, that counts as steady.
+        """
+        if window < 0 or window == 1:
+            raise ValueError("the steady state window needs at least 2 samples (or 0)")
+        self.absorbing = absorbing
+        self.window = window
+        self.tolerance = tolerance
+        self.samples = []
+        self.next_sample = None
+
+    def check(self, lattice):
+        """
+        call after every chunk of updates
+        :return: why the run should stop, or None to continue
+        """
+        if self.absorbing:
+            reason = absorbing_state(lattice)
+            if reason is not None:
+                return reason
+        if self.window:
+            return self.steady_state(lattice)
+        return None
+
+    def steady_state(self, lattice):
+        if self.next_sample is None:
+            self.next_sample = lattice.generation
+        if lattice.generation < self.next_sample:
+            return None
+        self.next_sample = lattice.generation + lattice.n_sites
+        self.samples.append(lattice.counts + (int(lattice.population[EMPTY]),))
+        if len(self.samples) < self.window:
+            return None
+        del self.samples[:-self.window]
+        samples = np.array(self.samples, dtype=float)
+        half = self.window // 2
+        drift = np.abs(samples[half:].mean(axis=0) - samples[:half].mean(axis=0))
+        if drift.max() <= self.tolerance * lattice.n_sites:
+            return "steady state (counts drifted by at most {:.0f} over {} samples)".format(
+                drift.max(), self.window)
+        return None
+
+
+def absorbing_state(lattice):
+    """
+    :return: a description of the absorbing state lattice is in, or None
+    """
+    population = lattice.population
+    if lattice.onlyRedBlue:
+        if population[RED] == 0 and population[BLUE] == 0:
+            return "red and blue extinct"
+        if population[RED] == 0:
+            return "red extinct"
+        if population[BLUE] == 0:
+            return "blue extinct"
+        return None
+    alive = np.count_nonzero(population) - (population[EMPTY] > 0)
+    if alive == 0:
+        return "all species extinct"
+    if alive == 1:
+        return "fixation of one species"
+    return None
@@ -0,0 +1,155 @@
+"""
+Invariants of Lattice: everything kept up to date incrementally (population,
+ghost cells, neighbor counts or kill sums, active sites) must match a
+recomputation from the sites alone.
+"""
+import numpy as np
+import pytest
+
+from backends import njit
+from boundary import BOUNDARIES, PERIODIC, REFLECTING
+from lattice import Lattice
+from sweep import COLUMN_OFFSETS, LINE_OFFSETS, OFFSETS
+from util import neighborhood_sum
+
+# size=[width, height]: rows, columns, both, a tiny square and a rectangle
+SIZES = [[12, 1], [1, 12], [2, 2], [7, 5]]
+
+needs_numba = pytest.mark.skipif(njit is None, reason="numba is not installed")
+
+
+def expected_padded(lattice):
+    """
+    the padded lattice built from the sites with np.pad, along the axes the
+    neighborhood reaches
+    """
+    x, y = lattice.x, lattice.y
+    mode = {PERIODIC: "wrap", REFLECTING: "symmetric"}.get(lattice.boundary, "constant")
+    padded = np.zeros((x + 2, y + 2), dtype=lattice.lattice.dtype)
+    if x == 1:
+        padded[1:-1] = np.pad(lattice.lattice, ((0, 0), (1, 1)), mode=mode)
+    elif y == 1:
+        padded[:, 1:-1] = np.pad(lattice.lattice, ((1, 1), (0, 0)), mode=mode)
+    else:
+        padded[...] = np.pad(lattice.lattice, 1, mode=mode)
+    return padded
+
+
+def check_invariants(lattice):
+    sites = np.array(lattice.lattice)
+    assert (lattice.population == np.bincount(sites.ravel(),
+                                              minlength=len(lattice.palette))).all()
+
+    padded = expected_padded(lattice)
+    assert (lattice.padded == padded).all()
+
+    offsets = LINE_OFFSETS if lattice.x == 1 else COLUMN_OFFSETS if lattice.y == 1 else OFFSETS
+    lattice.update_neighbors()
+    if lattice.onlyRedBlue:
+        for s in range(3):
+            counts = neighborhood_sum(padded == s, offsets)[1:-1, 1:-1]
+            assert (lattice.neighbors[s] == counts).all()
+    else:
+        sums = neighborhood_sum(lattice.kill_table[padded], offsets)[1:-1, 1:-1]
+        assert np.allclose(lattice.kill_sums, sums)
+
+    if lattice.active is not None:
+        counts = np.stack([neighborhood_sum(padded == s, offsets)[1:-1, 1:-1]
+                           for s in range(3)])
+        same = np.take_along_axis(counts, sites[None].astype(np.intp), 0)[0]
+        active = np.flatnonzero(counts.sum(axis=0) > same)
+        assert sorted(lattice.active.sites[:len(lattice.active)]) == active.tolist()
+
+
+def lattices(backend="python"):
+    for boundary in BOUNDARIES:
+        for size in SIZES:
+            for onlyRedBlue in (True, False):
+                yield dict(size=size, boundary=boundary, onlyRedBlue=onlyRedBlue,
+                           backend=backend, slider=0.05, density=0.8)
+
+
+def ids(params):
+    return "{size[0]}x{size[1]}-{boundary}-{mode}".format(
+        mode="rb" if params["onlyRedBlue"] else "any", **params)
+
+
+@pytest.mark.parametrize("params", list(lattices()), ids=ids)
+def test_new_lattice(params):
+    check_invariants(Lattice(seed=1, **params))
+
+
+@pytest.mark.parametrize("params", list(lattices()), ids=ids)
+def test_evolve(params):
+    lattice = Lattice(seed=2, activeSites=params["onlyRedBlue"], **params)
+    for t in range(5):
+        lattice.evolve(200)
+        check_invariants(lattice)
+
+
+@pytest.mark.parametrize("params", list(lattices()), ids=ids)
+def test_evolve_sweep(params):
+    lattice = Lattice(seed=3, **params)
+    for t in range(3):
+        lattice.evolve_sweep(2)
+        check_invariants(lattice)
+        # single site updates after bulk ones
+        lattice.evolve(100)
+        check_invariants(lattice)
+
+
+@needs_numba
+@pytest.mark.parametrize("params", list(lattices("numba")), ids=ids)
+def test_numba(params):
+    lattice = Lattice(seed=4, **params)
+    for t in range(3):
+        lattice.evolve(500)
+        check_invariants(lattice)
+
+
+@needs_numba
+def test_numba_streams_are_per_lattice():
+    def run(other):
+        lattice = Lattice(size=32, seed=5, onlyRedBlue=True, slider=0.01, backend="numba")
+        for t in range(3):
+            lattice.evolve(10000)
+            if other:
+                Lattice(size=8, seed=6, backend="numba").evolve(1000)
+        return lattice.lattice.copy()
+
+    assert (run(False) == run(True)).all()
+
+
+@needs_numba
+def test_numba_rejects_active_sites():
+    with pytest.raises(ValueError):
+        Lattice(size=8, onlyRedBlue=True, activeSites=True, backend="numba")
+
+
+def test_same_seed_same_run():
+    def run():
+        lattice = Lattice(size=[9, 6], seed=7, onlyRedBlue=True, slider=0.01)
+        lattice.evolve(3000)
+        lattice.evolve_sweep(2)
+        return lattice.lattice.copy()
+
+    assert (run() == run()).all()
+
+
+@pytest.mark.parametrize("activeSites", [False, True])
+@pytest.mark.parametrize("boundary", BOUNDARIES)
+def test_checkpoint_round_trip(tmp_path, boundary, activeSites):
+    lattice = Lattice(size=[9, 6], seed=8, onlyRedBlue=True, slider=0.02,
+                      boundary=boundary, activeSites=activeSites)
+    lattice.evolve(500)
+    lattice.save_checkpoint(str(tmp_path / "checkpoint"))
+    restored = Lattice.load_checkpoint(str(tmp_path / "checkpoint"))
+    assert restored.generation == lattice.generation
+    assert (restored.lattice == lattice.lattice).all()
+    assert restored.params == lattice.params
+    check_invariants(restored)
+
+    lattice.evolve(500)
+    restored.evolve(500)
+    assert restored.generation == lattice.generation
+    assert (restored.lattice == lattice.lattice).all()
@@ -0,0 +1,143 @@
+"""
+The observables against brute force counts over all pairs of sites.
+"""
+import numpy as np
+import pytest
+
+import observables
+from boundary import BOUNDARIES, PERIODIC
+from lattice import Lattice
+from observables import (InterfaceLength, domain_sizes, interface_length, label_domains,
+                         pair_correlation)
+from species import EMPTY
+
+SHAPES = [(1, 1), (1, 9), (9, 1), (2, 2), (2, 7), (3, 3), (8, 11)]
+
+
+def random_lattice(shape, seed, n_species=3):
+    return np.random.default_rng(seed).integers(0, n_species, size=shape).astype(np.uint8)
+
+
+def bonds(shape, periodic):
+    """
+    :return: set of nearest neighbor pairs ((i, j), (ni, nj)), each once
+    """
+    nx, ny = shape
+    pairs = set()
+    for i in range(nx):
+        for j in range(ny):
+            for ni, nj in ((i + 1, j), (i, j + 1)):
+                if periodic:
+                    ni, nj = ni % nx, nj % ny
+                if ni < nx and nj < ny and (ni, nj) != (i, j):
+                    pairs.add(frozenset([(i, j), (ni, nj)]))
+    return [tuple(pair) for pair in pairs]
+
+
+def brute_interface_length(a, periodic):
+    return sum(1 for p, q in bonds(a.shape, periodic)
+               if a[p] != a[q] and a[p] != EMPTY and a[q] != EMPTY)
+
+
+def brute_domains(a, periodic):
+    """
+    :return: list of domains, each a frozenset of sites, by flood fill
+    """
+    neighbors = {}
+    for p, q in bonds(a.shape, periodic):
+        if a[p] == a[q] != EMPTY:
+            neighbors.setdefault(p, []).append(q)
+            neighbors.setdefault(q, []).append(p)
+    seen, domains = set(), []
+    for site in zip(*np.nonzero(a != EMPTY)):
+        site = tuple(int(k) for k in site)
+        if site in seen:
+            continue
+        domain, todo = {site}, [site]
+        while todo:
+            for q in neighbors.get(todo.pop(), []):
+                if q not in domain:
+                    domain.add(q)
+                    todo.append(q)
+        seen |= domain
+        domains.append(frozenset(domain))
+    return domains
+
+
+@pytest.mark.parametrize("periodic", [False, True])
+@pytest.mark.parametrize("shape", SHAPES)
+def test_interface_length(shape, periodic, monkeypatch):
+    for seed in range(3):
+        a = random_lattice(shape, seed)
+        expected = brute_interface_length(a, periodic)
+        assert interface_length(a, periodic) == expected
+        # several blocks of rows
+        monkeypatch.setattr(observables, "BLOCK_ROWS", 2)
+        assert interface_length(a, periodic) == expected
+        monkeypatch.undo()
+
+
+@pytest.mark.parametrize("periodic", [False, True])
+@pytest.mark.parametrize("shape", SHAPES)
+def test_label_domains(shape, periodic):
+    for seed in range(3):
+        a = random_lattice(shape, seed)
+        labels = label_domains(a, periodic)
+        assert (labels[a == EMPTY] == -1).all()
+        domains = brute_domains(a, periodic)
+        for domain in domains:
+            ids = {int(labels[site]) for site in domain}
+            assert len(ids) == 1
+            # the label is the flat index of a site of the domain
+            assert np.unravel_index(ids.pop(), shape) in domain
+        assert len(np.unique(labels[labels >= 0])) == len(domains)
+
+        species, sizes = domain_sizes(a, periodic)
+        expected = sorted((int(a[next(iter(d))]), len(d)) for d in domains)
+        assert sorted(zip(species.tolist(), sizes.tolist())) == expected
+
+
+@pytest.mark.parametrize("periodic", [False, True])
+def test_pair_correlation(periodic):
+    a = random_lattice((6, 5), 1)
+    nx, ny = a.shape
+    r, g = pair_correlation(a, [1, 2], periodic=periodic)
+    for k, s in enumerate([1, 2]):
+        field = (a == s).astype(float)
+        density = field.mean()
+        products = np.zeros(len(r))
+        counts = np.zeros(len(r))
+        # every displacement the FFT sees, and all pairs of sites at it
+        extent = (nx, ny) if periodic else (2 * nx, 2 * ny)
+        for dx in range(-(extent[0] // 2), (extent[0] + 1) // 2):
+            for dy in range(-(extent[1] // 2), (extent[1] + 1) // 2):
+                distance = int(np.rint(np.hypot(dx, dy)))
+                if distance >= len(r):
+                    continue
+                total, pairs = 0.0, 0
+                for i in range(nx):
+                    for j in range(ny):
+                        ni, nj = i + dx, j + dy
+                        if periodic:
+                            ni, nj = ni % nx, nj % ny
+                        elif not (0 <= ni < nx and 0 <= nj < ny):
+                            continue
+                        total += field[i, j] * field[ni, nj]
+                        pairs += 1
+                if pairs:
+                    products[distance] += total / pairs / density ** 2
+                    counts[distance] += 1
+        assert np.allclose(g[k], products / np.maximum(counts, 1))
+
+
+@pytest.mark.parametrize("boundary", BOUNDARIES)
+@pytest.mark.parametrize("size", [[12, 1], [1, 12], [2, 2], [7, 5]])
+def test_interface_length_observer(size, boundary):
+    lattice = Lattice(size=size, seed=9, slider=0.05, density=0.8, boundary=boundary)
+    observer = InterfaceLength(lattice)
+    periodic = boundary == PERIODIC
+    for t in range(5):
+        lattice.evolve(100)
+        assert observer.length == brute_interface_length(lattice.lattice, periodic)
+    lattice.evolve_sweep(1)
+    assert observer.length == brute_interface_length(lattice.lattice, periodic)
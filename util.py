@@ -1,39 +1,31 @@
+import numpy as np
+
+
 def int2color(x):
     """
-    converts lattice integer to RGB tuple
+    converts a 0xRRGGBB color integer to an RGB list
     :param x: int
     :return: RGB
     """
-    # r = int(1000 * x % 255)
-    # g = int(10000 * x % 255)
-    # b = int(100000 * x % 255)
-    x = 0 if x == 0 else int(1/x)
     b = x & 0xff
     g = (x >> 8) & 0xff
     r = (x >> 16) & 0xff
     return [r, g, b]
 
 
-def has_colors(pix):
-    return (1 if pix[0] > 100 else 0,
-            1 if pix[1] > 100 else 0,
-            1 if pix[2] > 100 else 0)
-
-
-def int2color_tuple(x):
+def neighborhood_sum(padded, offsets):
     """
-    converts lattice integer to RGB tuple
-    :param x: int
-    :return: RGB
+    sums the cells at the given offsets from every cell of the inner part
+    of an array with a margin of one cell, see boundary.py
+    :param padded: 2d array (bool arrays are summed as uint8)
+    :param offsets: (row, column) offsets, at most 1 away
+    :return: array shaped like padded: the sums in its inner part, 0 in
+        the margin
     """
-    red_val = int(1000 * x % 255)
-    green_val = int(10000 * x % 255)
-    blue_val = int(100000 * x % 255)
-    return red_val, green_val, blue_val
-
-
-def count_colors(total, current):
-    for i in range(0, 3):
-        if current[i] > 100:
-            total[i] += 1
+    a = padded.astype(np.uint8) if padded.dtype == bool else padded
+    x, y = a.shape[0] - 2, a.shape[1] - 2
+    total = np.zeros_like(a)
+    inner = total[1:-1, 1:-1]
+    for di, dj in offsets:
+        inner += a[1 + di:1 + di + x, 1 + dj:1 + dj + y]
     return total